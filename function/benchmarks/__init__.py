@@ -0,0 +1 @@
+"""Offline benchmarks and sizing harnesses for the certbot Lambda."""
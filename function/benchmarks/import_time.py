@@ -0,0 +1,128 @@
+"""Measure the asset size and cold import time of the bundled handler per architecture.
+
+Builds the function asset twice per architecture inside the same image CDK
+bundles with: once with the plain ``pip install`` and once with the pruning and
+bytecode precompilation steps from ``bundling.json``, which
+``src/dependency-layer.ts`` also reads. Each import is timed in a
+fresh interpreter with the asset mounted read-only, as it is on Lambda.
+
+Usage (from the ``function`` directory, requires docker with binfmt/qemu for
+foreign architectures):
+
+    python -m benchmarks.import_time --architectures x86_64 arm64 --runs 5
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+
+BUNDLING_IMAGE = "public.ecr.aws/sam/build-python3.13"
+FUNCTION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(FUNCTION_DIR, "src")
+
+DOCKER_PLATFORMS = {"x86_64": "linux/amd64", "arm64": "linux/arm64"}
+with open(os.path.join(FUNCTION_DIR, "bundling.json"), encoding="utf-8") as bundling_file:
+    BUNDLING_STEPS = json.load(bundling_file)
+
+
+def asset_commands(commands, architecture):
+    """Fill the output directory and pip platform into commands from ``bundling.json``."""
+    # str.format would trip over the ``{}`` in the find command
+    return [
+        command.replace("{output}", "/asset-output")
+        .replace("{platform}", BUNDLING_STEPS["platforms"][architecture])
+        for command in commands
+    ]
+
+
+def install_commands(architecture):
+    """Return the plain install steps from ``bundling.json``, followed by copying the handler."""
+    return asset_commands(BUNDLING_STEPS["install"], architecture) + [
+        "cp /asset-input/index.py /asset-output/index.py",
+    ]
+
+
+def optimize_commands(architecture):
+    """Return the pruning and precompilation steps from ``bundling.json``."""
+    return asset_commands(BUNDLING_STEPS["optimize"], architecture)
+
+
+IMPORT_PROBE = (
+    "import sys, time; sys.path.insert(0, '/var/task'); "
+    "start = time.perf_counter(); import index; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def docker(architecture, mounts, *command):
+    """Run a command in the bundling image for the given architecture."""
+    args = ["docker", "run", "--rm", "--platform", DOCKER_PLATFORMS[architecture]]
+    for host, container, mode in mounts:
+        args += ["-v", f"{host}:{container}:{mode}"]
+    args += ["--entrypoint", command[0], BUNDLING_IMAGE, *command[1:]]
+    return subprocess.run(args, check=True, capture_output=True, text=True).stdout
+
+
+def build_asset(architecture, output_dir, optimize):
+    """Build the function asset into ``output_dir``."""
+    commands = install_commands(architecture) + (optimize_commands(architecture) if optimize else [])
+    docker(
+        architecture,
+        [(SRC_DIR, "/asset-input", "ro"), (output_dir, "/asset-output", "rw")],
+        "bash", "-c", " && ".join(commands),
+    )
+
+
+def directory_size_mb(path):
+    """Return the total size of the files below ``path`` in MB."""
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / (1024 * 1024)
+
+
+def time_imports(architecture, asset_dir, runs):
+    """Time ``import index`` in ``runs`` fresh interpreters."""
+    return [
+        float(docker(
+            architecture,
+            [(asset_dir, "/var/task", "ro")],
+            "python", "-c", IMPORT_PROBE,
+        ).strip())
+        for _ in range(runs)
+    ]
+
+
+def main(argv=None):
+    """Build and time each architecture and variant and print the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--architectures", nargs="+", default=list(DOCKER_PLATFORMS), choices=list(DOCKER_PLATFORMS))
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if shutil.which("docker") is None:
+        parser.error("docker is required to build and run the function asset")
+
+    results = []
+    for architecture in args.architectures:
+        for optimize in (False, True):
+            with tempfile.TemporaryDirectory() as asset_dir:
+                build_asset(architecture, asset_dir, optimize)
+                timings = time_imports(architecture, asset_dir, args.runs)
+                results.append({
+                    "architecture": architecture,
+                    "variant": "optimized" if optimize else "plain",
+                    "asset_size_mb": round(directory_size_mb(asset_dir), 2),
+                    "import_seconds_median": round(statistics.median(timings), 4),
+                    "import_seconds_min": round(min(timings), 4),
+                })
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
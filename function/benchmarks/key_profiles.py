@@ -0,0 +1,121 @@
+"""Measure key generation and signing cost for each issuance profile.
+
+Key generation runs once per issuance inside the function, while signing and
+verification run on every TLS handshake served with the certificate. Both are
+timed in process with the same cryptography backend certbot uses, and CPU time
+is reported next to wall time so results from shared hosts stay comparable.
+
+Usage (from the ``function`` directory, with the test requirements installed):
+
+    python -m benchmarks.key_profiles --profiles rsa2048 ecdsa-p256 --keys 5 --signatures 500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src import index  # pylint: disable=wrong-import-position
+
+# A TLS 1.3 CertificateVerify signs a transcript hash of this size
+MESSAGE = os.urandom(48)
+# The curves certbot accepts for ``--elliptic-curve``
+CURVES = {"secp256r1": ec.SECP256R1, "secp384r1": ec.SECP384R1, "secp521r1": ec.SECP521R1}
+
+
+def generate_key(profile):
+    """Generate a private key as certbot does with the arguments of an issuance profile."""
+    args = index.KEY_PROFILES[profile]["certbot"]
+    options = dict(zip(args[::2], args[1::2]))
+    if options["--key-type"] == "rsa":
+        return rsa.generate_private_key(
+            public_exponent=65537, key_size=int(options["--rsa-key-size"])
+        )
+    return ec.generate_private_key(CURVES[options["--elliptic-curve"]]())
+
+
+def sign(key, message):
+    """Sign ``message`` the way a TLS server does with this key type."""
+    if isinstance(key, rsa.RSAPrivateKey):
+        return key.sign(
+            message,
+            padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.DIGEST_LENGTH),
+            hashes.SHA256(),
+        )
+    return key.sign(message, ec.ECDSA(hashes.SHA256()))
+
+
+def verify(public_key, signature, message):
+    """Verify a signature made by ``sign``."""
+    if isinstance(public_key, rsa.RSAPublicKey):
+        public_key.verify(
+            signature,
+            message,
+            padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.DIGEST_LENGTH),
+            hashes.SHA256(),
+        )
+    else:
+        public_key.verify(signature, message, ec.ECDSA(hashes.SHA256()))
+
+
+def timed(func, *args):
+    """Call ``func`` and return its result with the wall and CPU seconds it took."""
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    result = func(*args)
+    return result, time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+
+def benchmark_profile(profile, keys, signatures):
+    """Time ``keys`` key generations and ``signatures`` signatures and verifications."""
+    generation = [timed(generate_key, profile) for _ in range(keys)]
+    key = generation[-1][0]
+    public_key = key.public_key()
+
+    _, sign_wall, sign_cpu = timed(lambda: [sign(key, MESSAGE) for _ in range(signatures)])
+    signature = sign(key, MESSAGE)
+    _, verify_wall, verify_cpu = timed(
+        lambda: [verify(public_key, signature, MESSAGE) for _ in range(signatures)]
+    )
+
+    return {
+        "profile": profile,
+        "certbot_args": index.KEY_PROFILES[profile]["certbot"],
+        "acm_key_type": index.KEY_PROFILES[profile]["acm"],
+        "keygen_ms_median": round(statistics.median(g[1] for g in generation) * 1000, 3),
+        "keygen_ms_max": round(max(g[1] for g in generation) * 1000, 3),
+        "keygen_cpu_ms_median": round(statistics.median(g[2] for g in generation) * 1000, 3),
+        "sign_us": round(sign_wall / signatures * 1_000_000, 2),
+        "sign_cpu_us": round(sign_cpu / signatures * 1_000_000, 2),
+        "verify_us": round(verify_wall / signatures * 1_000_000, 2),
+        "verify_cpu_us": round(verify_cpu / signatures * 1_000_000, 2),
+        "signature_bytes": len(signature),
+        "public_key_bytes": len(public_key.public_bytes(
+            serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+        )),
+    }
+
+
+def main(argv=None):
+    """Benchmark each profile and print the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--profiles", nargs="+", default=list(index.KEY_PROFILES), choices=list(index.KEY_PROFILES)
+    )
+    parser.add_argument("--keys", type=int, default=5, help="key generations per profile")
+    parser.add_argument("--signatures", type=int, default=500, help="signatures per profile")
+    args = parser.parse_args(argv)
+
+    results = [
+        benchmark_profile(profile, args.keys, args.signatures) for profile in args.profiles
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
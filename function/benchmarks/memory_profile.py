@@ -0,0 +1,304 @@
+"""Profile peak memory and wall time of the handler to size the Lambda.
+
+Runs the handler offline against moto with certbot replaced by a stub that
+writes a Let's Encrypt shaped certificate for the requested key type, then
+recommends the cheapest memory setting that fits the measured footprint.
+
+Each run happens in a fresh interpreter. Its footprint is the RSS after
+importing the handler, before moto is loaded, plus the allocations traced
+while the handler runs. Time spent inside AWS calls is moto emulating AWS in
+process, so it is taken out of the CPU time and replaced by an assumed
+network latency per call. Handler logs go to stderr and the results to stdout.
+
+Usage (from the ``function`` directory, with the test requirements installed):
+
+    python -m benchmarks.memory_profile --key-types rsa2048 ecdsa-p256 --cert-counts 1 5
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import pathlib
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from unittest.mock import patch
+
+import boto3
+from botocore.client import BaseClient
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+
+FUNCTION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(FUNCTION_DIR)
+import src.index as index  # pylint: disable=wrong-import-position
+
+# Lambda allocates one full vCPU at 1769 MB and scales CPU linearly below that
+FULL_VCPU_MB = 1769
+MEMORY_SIZES = [128, 256, 512, 768, 1024, 1536, 1769, 2048, 3008]
+# USD per GB-second and per request, us-east-1
+PRICE_PER_GB_SECOND = {"x86_64": 0.0000166667, "arm64": 0.0000133334}
+PRICE_PER_REQUEST = 0.0000002
+# Headroom kept above the measured peak RSS
+MEMORY_HEADROOM = 1.25
+# Assumed round trip of one AWS API call from Lambda, in place of moto's time
+AWS_LATENCY_MS = 30
+
+KEY_TYPES = {
+    "rsa2048": lambda: rsa.generate_private_key(public_exponent=65537, key_size=2048),
+    "rsa3072": lambda: rsa.generate_private_key(public_exponent=65537, key_size=3072),
+    "rsa4096": lambda: rsa.generate_private_key(public_exponent=65537, key_size=4096),
+    "ecdsa-p256": lambda: ec.generate_private_key(ec.SECP256R1()),
+    "ecdsa-p384": lambda: ec.generate_private_key(ec.SECP384R1()),
+}
+
+
+def build_certificate(key, domains):
+    """Build a self-signed certificate with the extension layout of a Let's Encrypt leaf."""
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, domains[0])])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    public_key = key.public_key()
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(public_key)
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=90))
+        .add_extension(
+            x509.KeyUsage(
+                digital_signature=True, content_commitment=False,
+                key_encipherment=isinstance(key, rsa.RSAPrivateKey),
+                data_encipherment=False, key_agreement=False, key_cert_sign=False,
+                crl_sign=False, encipher_only=False, decipher_only=False,
+            ),
+            critical=True,
+        )
+        .add_extension(
+            x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH]), critical=False
+        )
+        .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=True)
+        .add_extension(
+            x509.SubjectKeyIdentifier.from_public_key(public_key), critical=False
+        )
+        .add_extension(
+            x509.AuthorityKeyIdentifier.from_issuer_public_key(public_key),
+            critical=False,
+        )
+        .add_extension(
+            x509.AuthorityInformationAccess([
+                x509.AccessDescription(
+                    x509.oid.AuthorityInformationAccessOID.CA_ISSUERS,
+                    x509.UniformResourceIdentifier("http://r3.i.lencr.org/"),
+                )
+            ]),
+            critical=False,
+        )
+        .add_extension(
+            x509.SubjectAlternativeName([x509.DNSName(d) for d in domains]),
+            critical=False,
+        )
+    )
+    return builder.sign(key, hashes.SHA256())
+
+
+def fake_certbot(key_type):
+    """Return a stand-in for certbot.main.main that writes certificate files."""
+
+    def main(args):
+        domains = [d.strip() for d in args[args.index("-d") + 1].split(",")]
+        key = KEY_TYPES[key_type]()
+        cert = build_certificate(key, domains)
+        live = pathlib.Path("/tmp/config-dir/live/" + domains[0])
+        live.mkdir(parents=True, exist_ok=True)
+        (live / "cert.pem").write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+        (live / "chain.pem").write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+        (live / "privkey.pem").write_bytes(
+            key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.TraditionalOpenSSL,
+                serialization.NoEncryption(),
+            )
+        )
+
+    return main
+
+
+def peak_rss_mb():
+    """Return the peak resident set size of this process in MB."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+def cpu_seconds():
+    """Return user plus system CPU time consumed by this process."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def timed_aws_calls(totals):
+    """Return a replacement for ``BaseClient._make_api_call`` that adds up the time spent in AWS calls."""
+    make_api_call = BaseClient._make_api_call  # pylint: disable=protected-access
+
+    def wrapper(client, operation_name, api_params):
+        wall_start, cpu_start = time.perf_counter(), cpu_seconds()
+        try:
+            return make_api_call(client, operation_name, api_params)
+        finally:
+            totals["calls"] += 1
+            totals["wall"] += time.perf_counter() - wall_start
+            totals["cpu"] += cpu_seconds() - cpu_start
+
+    return wrapper
+
+
+def profile_run(key_type, cert_count, aws_latency_ms=AWS_LATENCY_MS):
+    """
+    Invoke the handler ``cert_count`` times and measure one warm container.
+
+    Must run in a fresh interpreter that has only imported this module, which
+    is what ``run_worker`` does.
+    """
+    # Taken before moto is loaded, this is close to the container after its init phase
+    import_rss = peak_rss_mb()
+    from moto import mock_aws  # pylint: disable=import-outside-toplevel
+
+    os.environ.update({
+        "LETSENCRYPT_EMAIL": "benchmark@example.com",
+        "PREFERRED_CHAIN": "ISRG Root X1",
+        "CERTIFICATE_STORAGE": "s3",
+        "CERTIFICATE_BUCKET": "benchmark-cert-bucket",
+        "OBJECT_PREFIX": "",
+        "KEY_TYPE": key_type,
+        "REISSUE_DAYS": "30",
+        "DRY_RUN": "False",
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "AWS_ACCESS_KEY_ID": "fake",
+        "AWS_SECRET_ACCESS_KEY": "fake",
+    })
+
+    aws = {"calls": 0, "wall": 0.0, "cpu": 0.0}
+    with (
+        mock_aws(),
+        patch("certbot.main.main", side_effect=fake_certbot(key_type)),
+        patch.object(BaseClient, "_make_api_call", timed_aws_calls(aws)),
+        contextlib.redirect_stdout(sys.stderr),
+    ):
+        boto3.client("s3").create_bucket(Bucket=os.environ["CERTIFICATE_BUCKET"])
+        topic = boto3.client("sns").create_topic(Name="benchmark-topic")
+        os.environ["NOTIFICATION_SNS_ARN"] = topic["TopicArn"]
+        aws.update(calls=0, wall=0.0, cpu=0.0)
+
+        tracemalloc.start()
+        cpu_start = cpu_seconds()
+        wall_start = time.perf_counter()
+        for n in range(cert_count):
+            os.environ["LETSENCRYPT_DOMAINS"] = f"cert{n}.example.com"
+            index.handler({}, None)
+        wall = time.perf_counter() - wall_start
+        cpu = cpu_seconds() - cpu_start
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    traced_peak_mb = traced_peak / (1024 * 1024)
+    return {
+        "key_type": key_type,
+        "cert_count": cert_count,
+        "aws_calls": aws["calls"],
+        "wall_seconds": round(wall - aws["wall"] + aws["calls"] * aws_latency_ms / 1000, 4),
+        "cpu_seconds": round(cpu - aws["cpu"], 4),
+        "import_rss_mb": round(import_rss, 2),
+        "traced_peak_mb": round(traced_peak_mb, 2),
+        "peak_rss_mb": round(import_rss + traced_peak_mb, 2),
+    }
+
+
+def run_worker(key_type, cert_count, aws_latency_ms=AWS_LATENCY_MS):
+    """Run ``profile_run`` in a fresh interpreter and return its measurement."""
+    output = subprocess.run(
+        [
+            sys.executable, "-m", "benchmarks.memory_profile",
+            "--worker", key_type, str(cert_count),
+            "--aws-latency-ms", str(aws_latency_ms),
+        ],
+        cwd=FUNCTION_DIR,
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def estimate_seconds(measurement, memory_mb):
+    """Estimate duration at ``memory_mb`` assuming this host runs one full vCPU."""
+    io_seconds = max(measurement["wall_seconds"] - measurement["cpu_seconds"], 0)
+    cpu_share = min(memory_mb, FULL_VCPU_MB) / FULL_VCPU_MB
+    return measurement["cpu_seconds"] / cpu_share + io_seconds
+
+
+def recommend_memory(measurements, architecture="x86_64", timeout_seconds=180):
+    """Return the cheapest memory size that fits every measurement, with its cost table."""
+    needed_mb = max(m["peak_rss_mb"] for m in measurements) * MEMORY_HEADROOM
+    table = []
+    for memory_mb in MEMORY_SIZES:
+        seconds = max(estimate_seconds(m, memory_mb) for m in measurements)
+        cost = (
+            seconds * memory_mb / 1024 * PRICE_PER_GB_SECOND[architecture]
+            + PRICE_PER_REQUEST
+        )
+        table.append({
+            "memory_mb": memory_mb,
+            "estimated_seconds": round(seconds, 3),
+            "cost_per_invocation_usd": round(cost, 10),
+            "fits": memory_mb >= needed_mb and seconds <= timeout_seconds,
+        })
+
+    candidates = [row for row in table if row["fits"]]
+    if not candidates:
+        raise ValueError(
+            f"No memory size fits a {needed_mb:.0f} MB footprint within {timeout_seconds}s"
+        )
+    best = min(candidates, key=lambda row: (row["cost_per_invocation_usd"], row["estimated_seconds"]))
+    return best["memory_mb"], table
+
+
+def main(argv=None):
+    """Run the profile matrix and print the measurements and recommendation as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--key-types", nargs="+", default=list(KEY_TYPES), choices=list(KEY_TYPES))
+    parser.add_argument("--cert-counts", nargs="+", type=int, default=[1, 5])
+    parser.add_argument("--architecture", default="x86_64", choices=list(PRICE_PER_GB_SECOND))
+    parser.add_argument("--timeout", type=int, default=180, help="Lambda timeout in seconds")
+    parser.add_argument(
+        "--aws-latency-ms", type=float, default=AWS_LATENCY_MS, help="assumed latency of one AWS call"
+    )
+    parser.add_argument("--worker", nargs=2, metavar=("KEY_TYPE", "CERT_COUNT"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(profile_run(args.worker[0], int(args.worker[1]), args.aws_latency_ms)))
+        return
+
+    measurements = [
+        run_worker(key_type, cert_count, args.aws_latency_ms)
+        for key_type in args.key_types
+        for cert_count in args.cert_counts
+    ]
+    memory_mb, table = recommend_memory(measurements, args.architecture, args.timeout)
+    print(json.dumps({
+        "measurements": measurements,
+        "costs": table,
+        "recommended_memory_mb": memory_mb,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
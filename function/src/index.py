@@ -2,121 +2,423 @@
 
 # Modified from original gist https://gist.github.com/arkadiyt/5d764c32baa43fc486ca16cb8488169a
 
+import base64
+import csv
 import datetime
+import hashlib
+import io
+import json
 import os
-import shutil
+import math
 import pathlib
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 
 import boto3
 import certbot.main
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
-from botocore.exceptions import ClientError
+from botocore.config import Config
+from botocore.exceptions import (
+    ClientError,
+    ConnectionClosedError,
+    ConnectTimeoutError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
 
 
-def store_in_secrets_manager(secret_name, secret_string):
-    """Store a secret in AWS Secrets Manager."""
-    client = boto3.client("secretsmanager")
+# Maximum seconds each phase may spend, including retries,
+# overridden with PHASE_BUDGET_<PHASE> environment variables
+PHASE_BUDGETS = {
+    "scan": 30, "issue": 150, "store": 20, "import": 20, "notify": 10, "report": 900,
+}
+# Minimum seconds that must remain in the invocation before a phase is started,
+# overridden with PHASE_MINIMUM_<PHASE> environment variables
+PHASE_MINIMUMS = {"scan": 5, "issue": 45, "store": 5, "import": 5, "notify": 3, "report": 5}
+# Seconds kept in reserve at the end of the invocation
+DEADLINE_MARGIN_SECONDS = 3
+
+RETRYABLE_ERROR_CODES = {
+    "InternalError",
+    "InternalFailure",
+    "RequestLimitExceeded",
+    "RequestTimeout",
+    "ServiceUnavailable",
+    "SlowDown",
+    "ThrottledException",
+    "Throttling",
+    "ThrottlingException",
+    "TooManyRequestsException",
+}
+RETRYABLE_EXCEPTIONS = (
+    ConnectionClosedError,
+    ConnectTimeoutError,
+    EndpointConnectionError,
+    ReadTimeoutError,
+)
+
+# Client side rate limiting and bounded timeouts, so a throttled call can't hang the invocation.
+# run_phase backs off between attempts itself, so botocore only retries once by default.
+AWS_CONFIG = Config(
+    retries={"mode": "adaptive", "max_attempts": int(os.getenv("RETRY_MAX_ATTEMPTS", "2"))},
+    connect_timeout=5,
+    read_timeout=20,
+)
+
+# Monotonic deadlines of the current invocation and phase
+DEADLINES = {"invocation": None, "phase": None}
+
+
+class DeadlineExceeded(Exception):
+    """Raised when there isn't enough time left to run a phase safely."""
+
+
+def aws_client(service, region=None):
+    """Create a boto3 client that uses the shared retry configuration."""
+    return boto3.client(service, region_name=region, config=AWS_CONFIG)
+
+
+def start_deadline(context):
+    """Record when the invocation must finish, from the Lambda context."""
+    get_remaining = getattr(context, "get_remaining_time_in_millis", None)
+    DEADLINES["invocation"] = (
+        time.monotonic() + get_remaining() / 1000 if get_remaining else None
+    )
+    DEADLINES["phase"] = None
+
+
+def remaining_seconds():
+    """Return the seconds left in the invocation, less the safety margin."""
+    if DEADLINES["invocation"] is None:
+        return math.inf
+    return DEADLINES["invocation"] - time.monotonic() - DEADLINE_MARGIN_SECONDS
+
+
+def check_deadline():
+    """Raise DeadlineExceeded if the current phase or the invocation is out of time."""
+    now = time.monotonic()
+    if DEADLINES["phase"] is not None and now > DEADLINES["phase"]:
+        raise DeadlineExceeded("The phase time budget was exhausted")
+    if remaining_seconds() <= 0:
+        raise DeadlineExceeded("The invocation is about to time out")
+
+
+def phase_seconds(setting, phase, defaults):
+    """Return a phase budget or minimum from the environment, or its default."""
+    return float(os.getenv(f"{setting}_{phase.upper()}", defaults[phase]))
+
+
+def is_retryable(error):
+    """Check whether an error from AWS is worth retrying."""
+    if isinstance(error, ClientError):
+        return error.response["Error"]["Code"] in RETRYABLE_ERROR_CODES
+    return isinstance(error, RETRYABLE_EXCEPTIONS)
+
+
+def run_phase(phase, func, *args, retry=True, **kwargs):
+    """
+    Run one phase of the handler within its time budget.
+
+    The phase is only started if enough of the invocation remains. Retryable
+    errors are retried with exponential backoff and jitter for as long as both
+    the phase budget and the invocation allow. Phases that aren't safe to
+    repeat are run with ``retry=False``.
+    """
+    budget = phase_seconds("PHASE_BUDGET", phase, PHASE_BUDGETS)
+    if remaining_seconds() < phase_seconds("PHASE_MINIMUM", phase, PHASE_MINIMUMS):
+        raise DeadlineExceeded(
+            f"Only {remaining_seconds():.1f}s left, not starting the {phase} phase"
+        )
+
+    DEADLINES["phase"] = time.monotonic() + min(budget, remaining_seconds())
     try:
-        create_args = {"Name": secret_name, "SecretString": secret_string}
+        if not retry:
+            return func(*args, **kwargs)
+        return call_with_backoff(phase, func, *args, **kwargs)
+    finally:
+        DEADLINES["phase"] = None
 
-        if "CUSTOM_KMS_KEY_ID" in os.environ:
-            create_args["KmsKeyId"] = os.environ["CUSTOM_KMS_KEY_ID"]
 
-        client.create_secret(**create_args)
-    except ClientError as e:
-        if e.response["Error"]["Code"] == "ResourceExistsException":
-            update_args = {"SecretId": secret_name, "SecretString": secret_string}
+def call_with_backoff(phase, func, *args, **kwargs):
+    """
+    Call ``func`` within the running phase, retrying retryable errors.
+
+    Retries use exponential backoff and jitter and stop when the phase budget
+    runs out. Concurrent calls within one phase share its deadline.
+    """
+    delay = 0.5
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            if not is_retryable(e):
+                raise
+            sleep = min(delay, 10) * random.uniform(0.5, 1)
+            if time.monotonic() + sleep >= DEADLINES["phase"]:
+                raise DeadlineExceeded(
+                    f"The {phase} phase ran out of time while retrying: {e}"
+                ) from e
+            print(f"WARN: Retrying the {phase} phase in {sleep:.1f}s after: {e}")
+            time.sleep(sleep)
+            delay *= 2
+
+
+CERT_FILES = {
+    "certificate": "cert.pem",
+    "private_key": "privkey.pem",
+    "certificate_chain": "chain.pem",
+}
+BUNDLE_FILE = "bundle.pem"
+# Backends without object metadata get this file after the certificate files,
+# so readers can tell a complete set from one that is being rewritten
+MANIFEST_NAME = "certbot-manifest.json"
+
+
+def find_existing_secrets(client, secret_names):
+    """Return the subset of secret names that already exist in Secrets Manager.
+
+    Lists every secret under the common prefix of the names in a single
+    paginated call instead of probing each secret individually.
+    """
+    prefix = os.path.commonprefix(list(secret_names))
+    list_args = {"Filters": [{"Key": "name", "Values": [prefix]}]} if prefix else {}
+
+    existing = set()
+    for page in client.get_paginator("list_secrets").paginate(**list_args):
+        existing.update(secret["Name"] for secret in page["SecretList"])
+
+    return existing & set(secret_names)
+
+
+def store_secrets_in_secrets_manager(secrets):
+    """Store several secrets in AWS Secrets Manager.
+
+    ``secrets`` maps secret names to secret strings. Existing secrets are
+    detected up front so each secret costs exactly one create or update call.
+    """
+    client = aws_client("secretsmanager")
+    existing = find_existing_secrets(client, secrets)
+
+    for secret_name, secret_string in secrets.items():
+        if secret_name not in existing:
+            create_args = {"Name": secret_name, "SecretString": secret_string}
 
             if "CUSTOM_KMS_KEY_ID" in os.environ:
-                update_args["KmsKeyId"] = os.environ["CUSTOM_KMS_KEY_ID"]
+                create_args["KmsKeyId"] = os.environ["CUSTOM_KMS_KEY_ID"]
 
-            client.update_secret(**update_args)
+            try:
+                client.create_secret(**create_args)
+                continue
+            except ClientError as e:
+                # Created by someone else since the listing, fall through to an update
+                if e.response["Error"]["Code"] != "ResourceExistsException":
+                    raise
 
+        update_args = {"SecretId": secret_name, "SecretString": secret_string}
 
-def store_in_parameter_store(param_name, param_value):
-    """Store a parameter in AWS Systems Manager Parameter Store."""
-    ssm = boto3.client("ssm")
-    put_param_args = {
-        "Name": param_name,
-        "Value": param_value,
-        "Type": "SecureString",
-        "Overwrite": True,
-    }
+        if "CUSTOM_KMS_KEY_ID" in os.environ:
+            update_args["KmsKeyId"] = os.environ["CUSTOM_KMS_KEY_ID"]
+
+        client.update_secret(**update_args)
+
+
+def store_parameters_in_parameter_store(params):
+    """Store several parameters in AWS Systems Manager Parameter Store.
+
+    ``params`` maps parameter names to values. Current values are fetched in
+    batches of ten and parameters whose value is unchanged are not rewritten.
+    """
+    ssm = aws_client("ssm")
+    names = list(params)
 
-    if "CUSTOM_KMS_KEY_ID" in os.environ:
-        put_param_args["KeyId"] = os.environ["CUSTOM_KMS_KEY_ID"]
+    current = {}
+    for i in range(0, len(names), 10):
+        response = ssm.get_parameters(Names=names[i:i + 10], WithDecryption=True)
+        current.update({p["Name"]: p["Value"] for p in response["Parameters"]})
 
-    ssm.put_parameter(**put_param_args)
+    for param_name, param_value in params.items():
+        if current.get(param_name) == param_value:
+            print(f"INFO: Parameter {param_name} is unchanged, skipping write")
+            continue
 
+        put_param_args = {
+            "Name": param_name,
+            "Value": param_value,
+            "Type": "SecureString",
+            "Overwrite": True,
+        }
+
+        if "CUSTOM_KMS_KEY_ID" in os.environ:
+            put_param_args["KeyId"] = os.environ["CUSTOM_KMS_KEY_ID"]
+
+        ssm.put_parameter(**put_param_args)
+
+
+def certificate_metadata(certificate):
+    """
+    Summarize a PEM certificate for object metadata and notifications.
 
-def upload_to_s3(local_path, keyname):
-    """Upload a file to an S3 bucket."""
+    Returns the serial number in hex, the expiry date and a SHA-256 digest of
+    the sorted subject alternative names.
+    """
+    cert = x509.load_pem_x509_certificate(certificate, default_backend())
+    try:
+        sans = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+        names = sorted(str(name.value) for name in sans)
+    except x509.ExtensionNotFound:
+        names = []
+
+    return {
+        "serial": format(cert.serial_number, "x"),
+        "not-after": cert.not_valid_after_utc.isoformat(),
+        "san-digest": hashlib.sha256(",".join(names).encode("utf-8")).hexdigest(),
+    }
+
+
+def upload_to_s3(contents, keyname, metadata=None):
+    """
+    Upload a file to an S3 bucket.
+
+    The SHA-256 checksum is computed here and sent with the request so S3 can
+    verify the upload without the SDK hashing the body again.
+    """
     print(f"INFO: Uploading {keyname} to S3")
-    s3 = boto3.resource("s3")
-    with open(local_path, "rb") as file:
-        data = file.read()
-        s3.Bucket(os.environ["CERTIFICATE_BUCKET"]).put_object( # type: ignore
-            Key=f"{os.environ['OBJECT_PREFIX']}{keyname}",
-            Body=data,  # type: ignore
-        )
+    aws_client("s3").put_object(
+        Bucket=os.environ["CERTIFICATE_BUCKET"],
+        Key=f"{os.environ['OBJECT_PREFIX']}{keyname}",
+        Body=contents,
+        ContentType="application/x-pem-file",
+        ChecksumSHA256=base64.b64encode(hashlib.sha256(contents).digest()).decode("ascii"),
+        Metadata=metadata or {},
+    )
 
 
-def copy_to_efs(local_path, filename):
-    """Copy a file to EFS."""
+def copy_to_efs(contents, filename):
+    """Write a file to EFS."""
     print(f"INFO: Copying {filename} to EFS")
 
     # If we are using a prefix, we need to create the directory structure
     # We already validated that EFS_PATH is a directory
-    pathlib.Path(
-        os.environ["EFS_PATH"] + "/" + os.environ["OBJECT_PREFIX"]
-    ).mkdir(parents=True, exist_ok=True)
+    directory = pathlib.Path(os.environ["EFS_PATH"] + "/" + os.environ["OBJECT_PREFIX"])
+    directory.mkdir(parents=True, exist_ok=True)
 
-    shutil.copy(
-        local_path,
-        os.environ["EFS_PATH"] + "/" + os.environ["OBJECT_PREFIX"] + "/" + filename,
-    )
+    # Write to a temporary file and rename it so readers never see a partial file
+    temporary = directory / f".{filename}.tmp"
+    temporary.write_bytes(contents)
+    os.replace(temporary, directory / filename)
 
 
-def read_and_delete_file(path, filename, storage_method):
-    """Read a file, upload it, and delete it afterwards."""
-    if not os.getenv("DRY_RUN", "False").lower() in ["true", "1"]:
-        with open(path, "rb") as file:
-            contents = file.read()
+def read_file(path, filename):
+    """Read a certificate file and check that it is valid UTF-8."""
+    with open(path, "rb") as file:
+        contents = file.read()
 
-        try:
-            string_contents = contents.decode("utf-8")
-        except UnicodeDecodeError:
-            print(
-                f"Error: The file {filename} contains binary data that can't be "
-                "decoded as UTF-8."
-            )
-            raise
+    try:
+        contents.decode("utf-8")
+    except UnicodeDecodeError:
+        print(
+            f"Error: The file {filename} contains binary data that can't be "
+            "decoded as UTF-8."
+        )
+        raise
+
+    return contents
+
+
+def store_files(files, storage_method):
+    """
+    Store certificate files in the configured backend.
+
+    ``files`` maps each filename to its contents. Secrets Manager and Parameter
+    Store writes are batched across all of the files.
+    """
+    if storage_method == "s3":
+        # Every object carries the certificate's metadata so consumers can check it with HeadObject
+        metadata = certificate_metadata(files["cert.pem"]) if "cert.pem" in files else {}
+        for filename, contents in files.items():
+            upload_to_s3(contents, filename, metadata)
+    elif storage_method == "secretsmanager":
+        store_secrets_in_secrets_manager({
+            os.environ["CERTIFICATE_SECRET_PATH"] + filename: contents.decode("utf-8")
+            for filename, contents in files.items()
+        })
+    elif storage_method == "ssm_secure":
+        store_parameters_in_parameter_store({
+            os.environ["CERTIFICATE_PARAMETER_PATH"] + filename: contents.decode("utf-8")
+            for filename, contents in files.items()
+        })
+    elif storage_method == "efs":
+        for filename, contents in files.items():
+            copy_to_efs(contents, filename)
+
+
+def certificate_manifest(cert):
+    """Return the manifest of a certificate, key and chain: a SHA-256 digest of the three."""
+    digest = hashlib.sha256()
+    for key in CERT_FILES:
+        digest.update(cert[key])
+    return json.dumps({"digest": digest.hexdigest()}).encode("utf-8")
 
-        if storage_method == "s3":
-            upload_to_s3(path, filename)
-        elif storage_method == "secretsmanager":
-            store_in_secrets_manager(
-                os.environ["CERTIFICATE_SECRET_PATH"] + filename,
-                string_contents,
-            )
-        elif storage_method == "ssm_secure":
-            store_in_parameter_store(
-                os.environ["CERTIFICATE_PARAMETER_PATH"] + filename,
-                string_contents,
-            )
-        elif storage_method == "efs":
-            copy_to_efs(path, filename)
 
-        os.remove(path)
-        return contents
+def store_cert(cert, storage_method):
+    """Store the certificate, private key and chain in the configured backend."""
+    files = {filename: cert[key] for key, filename in CERT_FILES.items()}
 
-    print(f"WARN: Dry run was used so {filename} was not generated.")
+    # S3 objects carry the serial in their metadata instead. The files are
+    # written in order, so the manifest only matches once all three are stored.
+    if storage_method != "s3":
+        manifest_name = "." + MANIFEST_NAME if storage_method == "efs" else MANIFEST_NAME
+        files[manifest_name] = certificate_manifest(cert)
+
+    # An optional single object with the full chain and key lets S3 consumers fetch once
+    if storage_method == "s3" and os.getenv("COMBINED_BUNDLE", "False").lower() in ["true", "1"]:
+        files[BUNDLE_FILE] = (
+            cert["certificate"].rstrip(b"\n") + b"\n"
+            + cert["certificate_chain"].rstrip(b"\n") + b"\n"
+            + cert["private_key"]
+        )
+
+    store_files(files, storage_method)
+
+
+KEY_PROFILES = {
+    "rsa2048": {"certbot": ["--key-type", "rsa", "--rsa-key-size", "2048"], "acm": "RSA_2048"},
+    "rsa3072": {"certbot": ["--key-type", "rsa", "--rsa-key-size", "3072"], "acm": "RSA_3072"},
+    "rsa4096": {"certbot": ["--key-type", "rsa", "--rsa-key-size", "4096"], "acm": "RSA_4096"},
+    "ecdsa-p256": {
+        "certbot": ["--key-type", "ecdsa", "--elliptic-curve", "secp256r1"],
+        "acm": "EC_prime256v1",
+    },
+    "ecdsa-p384": {
+        "certbot": ["--key-type", "ecdsa", "--elliptic-curve", "secp384r1"],
+        "acm": "EC_secp384r1",
+    },
+}
+# The plain certbot key types map to certbot's defaults for size and curve
+KEY_PROFILE_ALIASES = {"rsa": "rsa2048", "ecdsa": "ecdsa-p256"}
+
+
+def key_profile(key_type):
+    """Return the issuance profile for a ``KEY_TYPE`` value, accepting plain certbot key types."""
+    name = KEY_PROFILE_ALIASES.get(key_type.lower(), key_type.lower())
+    if name not in KEY_PROFILES:
+        raise ValueError(
+            f"KEY_TYPE {key_type} is not one of {', '.join([*KEY_PROFILES, *KEY_PROFILE_ALIASES])}"
+        )
+    return KEY_PROFILES[name]
 
 
 def provision_cert(email, domains, storage_method, keytype):
-    """Provision a new SSL certificate with Certbot."""
+    """
+    Provision a new SSL certificate with Certbot.
+
+    The issued material is checkpointed in the storage backend before the local
+    files are removed, so a later invocation can finish storing and importing it.
+    """
     cerbot_args = [
         "certonly",  # Obtain a cert but don't install it
         "-n",  # Run in non-interactive mode
@@ -126,8 +428,7 @@ def provision_cert(email, domains, storage_method, keytype):
         "--dns-route53",  # Use dns challenge with route53
         "-d",
         domains,  # Domains to provision certs for
-        "--key-type",
-        keytype,  # Key type
+        *key_profile(keytype)["certbot"],  # Key type and size or curve
         # Override directory paths so script doesn't have to be run as root
         "--config-dir",
         "/tmp/config-dir/",
@@ -144,32 +445,49 @@ def provision_cert(email, domains, storage_method, keytype):
 
     certbot.main.main(cerbot_args)
 
+    if os.getenv("DRY_RUN", "False").lower() in ["true", "1"]:
+        for filename in CERT_FILES.values():
+            print(f"WARN: Dry run was used so {filename} was not generated.")
+        return dict.fromkeys(CERT_FILES)
+
     first_domain = domains.split(",")[0]
     path = "/tmp/config-dir/live/" + first_domain + "/"
-    return {
-        "certificate": read_and_delete_file(
-            path + "cert.pem", "cert.pem", storage_method
-        ),
-        "private_key": read_and_delete_file(
-            path + "privkey.pem", "privkey.pem", storage_method
-        ),
-        "certificate_chain": read_and_delete_file(
-            path + "chain.pem", "chain.pem", storage_method
-        ),
+    cert = {
+        key: read_file(path + filename, filename)
+        for key, filename in CERT_FILES.items()
     }
+    save_checkpoint(storage_method, domains, "issued", cert)
+
+    for filename in CERT_FILES.values():
+        os.remove(path + filename)
+    return cert
+
+
+def acm_regions():
+    """Return the regions the certificate is imported into, the function's own region by default."""
+    regions = [r.strip() for r in os.getenv("ACM_REGIONS", "").split(",") if r.strip()]
+    return regions or [boto3.session.Session().region_name]
 
 
 def should_provision(domains):
     """
     Determine if a new certificate should be provisioned.
-    Returns True if:
+    Returns True if, in any of the ACM regions:
       - No existing cert found, or
       - The existing cert expires soon, or
       - The domains differ from those in the current ACM certificate.
+
+    One issuance is imported into every region, so every region is checked.
     """
-    existing_cert = find_existing_cert(domains)
+    results = [region_needs_certificate(domains, region) for region in acm_regions()]
+    return any(results)
+
+
+def region_needs_certificate(domains, region):
+    """Check the certificate in a single ACM region for a domain mismatch or expiry."""
+    existing_cert = find_existing_cert(domains, region)
     if existing_cert:
-        print("INFO: Cert already exists. Checking domains and expiry date.")
+        print(f"INFO: Cert already exists in {region}. Checking domains and expiry date.")
 
         # --- Check for domain mismatch ---
         existing_domains = set(
@@ -196,38 +514,68 @@ def should_provision(domains):
             print(f"INFO: Cert valid for more than {reissue_days} days, no reissue needed.")
         return reissue
 
-    print("INFO: Cert not found in ACM. Will issue new cert.")
+    print(f"INFO: Cert not found in ACM in {region}. Will issue new cert.")
     return True
 
 
-@lru_cache
-def find_existing_cert(domains):
-    """Find an existing certificate in ACM."""
-    domains = frozenset(domains.split(","))
+STORAGE_TAG = "certbot:storage"
 
-    client = boto3.client("acm")
+REPORT_FIELDS = [
+    "certificate_arn",
+    "region",
+    "domain_name",
+    "subject_alternative_names",
+    "not_after",
+    "days_remaining",
+    "status",
+    "in_use",
+    "storage",
+    "stored_serial",
+    "stored_not_after",
+]
+
+ACM_KEY_TYPES = [
+    "RSA_1024",
+    "RSA_2048",
+    "RSA_3072",
+    "RSA_4096",
+    "EC_prime256v1",
+    "EC_secp384r1",
+    "EC_secp521r1",
+]
+
+
+def list_acm_certificates(client, max_items=None, key_types=None):
+    """
+    Yield the summary of every certificate in ACM with one of ``key_types``.
+
+    Every key type is listed by default.
+    """
     paginator = client.get_paginator("list_certificates")
     iterator = paginator.paginate(
-        PaginationConfig={"MaxItems": 1000},
-        Includes={
-            "keyTypes": [
-                "RSA_1024",
-                "RSA_2048",
-                "RSA_3072",
-                "RSA_4096",
-                "EC_prime256v1",
-                "EC_secp384r1",
-                "EC_secp521r1",
-            ]
-        },
+        PaginationConfig={"MaxItems": max_items} if max_items else {},
+        Includes={"keyTypes": key_types or ACM_KEY_TYPES},
     )
 
     for page in iterator:
-        for cert in page["CertificateSummaryList"]:
-            cert = client.describe_certificate(CertificateArn=cert["CertificateArn"])
-            sans = frozenset(cert["Certificate"]["SubjectAlternativeNames"])
-            if sans.issubset(domains):
-                return cert
+        yield from page["CertificateSummaryList"]
+
+
+@lru_cache
+def find_existing_cert(domains, region=None):
+    """Find an existing certificate in ACM in the given region."""
+    domains = frozenset(domains.split(","))
+
+    # Certificates with another key type belong to another profile and are left alone
+    key_types = [key_profile(os.environ["KEY_TYPE"])["acm"]]
+
+    client = aws_client("acm", region)
+    for cert in list_acm_certificates(client, max_items=1000, key_types=key_types):
+        check_deadline()
+        cert = client.describe_certificate(CertificateArn=cert["CertificateArn"])
+        sans = frozenset(cert["Certificate"]["SubjectAlternativeNames"])
+        if sans.issubset(domains):
+            return cert
 
     return None
 
@@ -235,6 +583,7 @@ def find_existing_cert(domains):
 def get_cert_info(certificate):
     """Extract basic information from a certificate."""
     cert = x509.load_pem_x509_certificate(certificate, default_backend())
+    sans = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
     # could technically dig in and get all key info here, but this is the basics
     cert_info = f"""Certificate info:
     Serial Number: {cert.serial_number}
@@ -243,68 +592,750 @@ def get_cert_info(certificate):
         Not Before: {cert.not_valid_before_utc}
         Not After: {cert.not_valid_after_utc}
     Subject: {cert.subject.rfc4514_string()}
-    Subject Alternative Names: {" ".join([n.value for n in cert.extensions[6].value])}
+    Subject Alternative Names: {" ".join([n.value for n in sans])}
 """
     return cert_info
 
 
-def notify_via_sns(topic_arn, domains, certificate):
-    """Send a notification via SNS."""
-    print("INFO: Sending SNS notification")
-    cert = get_cert_info(certificate)
-
-    client = boto3.client("sns")
-    client.publish(
-        TopicArn=topic_arn,
-        Subject="Issued new LetsEncrypt certificate",
-        Message=(
-            "Issued new certificates for domains: "
-            + domains
-            + "\n\n"
-            + cert
-        ),
+NOTIFICATION_EVENT = "certificate.issued"
+SNS_BATCH_SIZE = 10
+
+
+def certificate_notification(domains, certificate, certificate_arns=None):
+    """
+    Build the notification for one issued certificate.
+
+    The message text and the structured fields are computed once here, so the
+    summary and the per-certificate messages don't parse the PEM again.
+    """
+    metadata = certificate_metadata(certificate)
+    arns = certificate_arns or {}
+    message = (
+        "Issued new certificates for domains: "
+        + domains
+        + "\n\n"
+        + get_cert_info(certificate)
+        + "".join(f"    ACM ({region}): {arn}\n" for region, arn in arns.items())
+    )
+    return {
+        "domains": [d.strip() for d in domains.split(",")],
+        "serial": metadata["serial"],
+        "not_after": metadata["not-after"],
+        "certificate_arns": arns,
+        "message": message,
+    }
+
+
+def notification_attributes(notifications):
+    """
+    Build the SNS message attributes for one or more notifications.
+
+    Array attributes can be matched by subscription filter policies, and
+    ``certificates`` holds every structured field as JSON.
+    """
+    def string_array(values):
+        return {"DataType": "String.Array", "StringValue": json.dumps(sorted(set(values)))}
+
+    return {
+        "event": {"DataType": "String", "StringValue": NOTIFICATION_EVENT},
+        "domains": string_array(d for n in notifications for d in n["domains"]),
+        "serials": string_array(n["serial"] for n in notifications),
+        "regions": string_array(r for n in notifications for r in n["certificate_arns"]),
+        "certificates": {
+            "DataType": "String",
+            "StringValue": json.dumps(
+                [{k: v for k, v in n.items() if k != "message"} for n in notifications]
+            ),
+        },
+    }
+
+
+def publish_notifications(topic_arn, notifications):
+    """
+    Publish the notifications collected during a run.
+
+    By default one summary message covers every certificate. With
+    ``NOTIFICATION_MODE`` set to ``per_certificate`` each certificate gets its
+    own message, sent with ``PublishBatch`` in groups of ten.
+    """
+    if not notifications:
+        return
+
+    client = aws_client("sns")
+    if os.getenv("NOTIFICATION_MODE", "summary").lower() != "per_certificate":
+        print(f"INFO: Sending SNS summary for {len(notifications)} certificate(s)")
+        client.publish(
+            TopicArn=topic_arn,
+            Subject=(
+                "Issued new LetsEncrypt certificate" if len(notifications) == 1
+                else f"Issued {len(notifications)} new LetsEncrypt certificates"
+            ),
+            Message="\n\n".join(n["message"] for n in notifications),
+            MessageAttributes=notification_attributes(notifications),
+        )
+        return
+
+    print(f"INFO: Sending {len(notifications)} SNS notification(s)")
+    for start in range(0, len(notifications), SNS_BATCH_SIZE):
+        batch = notifications[start:start + SNS_BATCH_SIZE]
+        response = client.publish_batch(
+            TopicArn=topic_arn,
+            PublishBatchRequestEntries=[
+                {
+                    "Id": f"certificate-{start + i}",
+                    "Subject": "Issued new LetsEncrypt certificate",
+                    "Message": notification["message"],
+                    "MessageAttributes": notification_attributes([notification]),
+                }
+                for i, notification in enumerate(batch)
+            ],
+        )
+        if response.get("Failed"):
+            raise RuntimeError(f"Failed to publish SNS notifications: {response['Failed']}")
+
+
+def notify_via_sns(topic_arn, domains, certificate, certificate_arns=None):
+    """Send a notification via SNS for the certificate issued in this run."""
+    publish_notifications(
+        topic_arn, [certificate_notification(domains, certificate, certificate_arns)]
     )
 
 
-def upload_cert_to_acm(cert, domains):
-    """Upload a certificate to AWS Certificate Manager (ACM)."""
-    print("INFO: Importing cert to ACM")
-    existing_cert = find_existing_cert(domains)
+def storage_location(storage_method):
+    """Describe where the certificate files are stored, for tagging and reports."""
+    if storage_method == "s3":
+        return f"s3://{os.environ['CERTIFICATE_BUCKET']}/{os.environ['OBJECT_PREFIX']}"
+    if storage_method == "secretsmanager":
+        return "secretsmanager:" + os.environ["CERTIFICATE_SECRET_PATH"]
+    if storage_method == "ssm_secure":
+        return "ssm:" + os.environ["CERTIFICATE_PARAMETER_PATH"]
+    if storage_method == "efs":
+        return f"efs:{os.environ['EFS_PATH']}/{os.environ['OBJECT_PREFIX']}"
+    return storage_method
+
+
+def import_cert_to_region(cert, domains, region, tags):
+    """
+    Import a certificate into ACM in one region, reimporting over an existing one.
+
+    Returns the ARN of the certificate in that region.
+    """
+    print(f"INFO: Importing cert to ACM in {region}")
+    existing_cert = find_existing_cert(domains, region)
     certificate_arn = (
         existing_cert["Certificate"]["CertificateArn"]
         if existing_cert else None
     )
 
-    client = boto3.client("acm")
+    client = aws_client("acm", region)
     if certificate_arn is None:
         acm_response = client.import_certificate(
             Certificate=cert["certificate"],
             PrivateKey=cert["private_key"],
             CertificateChain=cert["certificate_chain"],
+            Tags=tags,
         )
-    else:
-        acm_response = client.import_certificate(
-            CertificateArn=certificate_arn,
-            Certificate=cert["certificate"],
-            PrivateKey=cert["private_key"],
-            CertificateChain=cert["certificate_chain"],
+        return acm_response["CertificateArn"]
+
+    client.import_certificate(
+        CertificateArn=certificate_arn,
+        Certificate=cert["certificate"],
+        PrivateKey=cert["private_key"],
+        CertificateChain=cert["certificate_chain"],
+    )
+    # Tags can't be given when reimporting
+    client.add_tags_to_certificate(CertificateArn=certificate_arn, Tags=tags)
+    return certificate_arn
+
+
+def upload_cert_to_acm(cert, domains, storage_method, regions=None):
+    """
+    Upload a certificate to AWS Certificate Manager (ACM) in every target region.
+
+    The regions are imported in parallel, and each certificate is tagged with
+    where ``storage_method`` keeps its files. Returns the certificate ARN per region.
+    """
+    regions = regions or acm_regions()
+    tags = [{"Key": STORAGE_TAG, "Value": storage_location(storage_method)}]
+
+    with ThreadPoolExecutor(max_workers=len(regions)) as executor:
+        arns = executor.map(
+            lambda region: import_cert_to_region(cert, domains, region, tags), regions
         )
+        certificate_arns = dict(zip(regions, arns))
 
-    return None if certificate_arn else acm_response["CertificateArn"]
+    for region, certificate_arn in certificate_arns.items():
+        print(f"INFO: Certificate in {region}: {certificate_arn}")
+    return certificate_arns
 
 
-def handler(_event, _context):
-    """Lambda function handler."""
-    storage_method = os.getenv("CERTIFICATE_STORAGE", "s3").lower()
+def read_stored_certificate(storage_method):
+    """Read the stored cert.pem from the storage backend, or None if it doesn't exist."""
+    try:
+        if storage_method == "s3":
+            obj = aws_client("s3").get_object(
+                Bucket=os.environ["CERTIFICATE_BUCKET"],
+                Key=os.environ["OBJECT_PREFIX"] + "cert.pem",
+            )
+            return obj["Body"].read()
+        if storage_method == "secretsmanager":
+            secret = aws_client("secretsmanager").get_secret_value(
+                SecretId=os.environ["CERTIFICATE_SECRET_PATH"] + "cert.pem"
+            )
+            return secret["SecretString"].encode("utf-8")
+        if storage_method == "ssm_secure":
+            params = aws_client("ssm").get_parameters(
+                Names=[os.environ["CERTIFICATE_PARAMETER_PATH"] + "cert.pem"],
+                WithDecryption=True,
+            )["Parameters"]
+            return params[0]["Value"].encode("utf-8") if params else None
+        if storage_method == "efs":
+            path = pathlib.Path(
+                os.environ["EFS_PATH"] + "/" + os.environ["OBJECT_PREFIX"] + "/cert.pem"
+            )
+            return path.read_bytes() if path.exists() else None
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ["NoSuchKey", "ResourceNotFoundException"]:
+            return None
+        raise
+    return None
+
+
+def describe_certificate_with_tags(client, certificate_arn):
+    """Describe a certificate in ACM and fetch its tags."""
+    # Queued descriptions are skipped once the report is out of time
+    check_deadline()
+    cert = client.describe_certificate(CertificateArn=certificate_arn)["Certificate"]
+    tags = client.list_tags_for_certificate(CertificateArn=certificate_arn).get("Tags", [])
+    return cert, {tag["Key"]: tag.get("Value", "") for tag in tags}
+
+
+def describe_report_candidates(clients, cutoff, concurrency):
+    """
+    Describe every certificate in ``clients`` that the list summaries show expiring by ``cutoff``.
+
+    Each call is retried with backoff within the report phase. Returns the
+    region, certificate and tags of each candidate, and whether the phase ran
+    out of time before every candidate was described.
+    """
+    described = []
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        try:
+            for region, client in clients.items():
+                summaries = call_with_backoff(
+                    "report", lambda c=client: list(list_acm_certificates(c))
+                )
+                futures = [
+                    executor.submit(
+                        call_with_backoff,
+                        "report",
+                        describe_certificate_with_tags,
+                        client,
+                        summary["CertificateArn"],
+                    )
+                    for summary in summaries
+                    if "NotAfter" not in summary or summary["NotAfter"] <= cutoff
+                ]
+                described.extend((region, *future.result()) for future in futures)
+        except DeadlineExceeded as e:
+            print(f"WARN: Returning a truncated report: {e}")
+            executor.shutdown(wait=False, cancel_futures=True)
+            return described, True
+    return described, False
+
+
+def certificate_domains(cert):
+    """Return the domain name and subject alternative names of an ACM certificate."""
+    return set([cert["DomainName"]] + cert.get("SubjectAlternativeNames", []))
+
+
+def report_row(region, cert, tags, stored_cert, now):
+    """Build the report row of a certificate, joined with ``stored_cert`` if it is managed here."""
+    not_after = cert["NotAfter"]
+    managed_here = stored_cert is not None
+    return {
+        "certificate_arn": cert["CertificateArn"],
+        "region": region,
+        "domain_name": cert["DomainName"],
+        "subject_alternative_names": " ".join(cert.get("SubjectAlternativeNames", [])),
+        "not_after": not_after.isoformat(),
+        "days_remaining": (not_after - now).days,
+        "status": cert.get("Status", ""),
+        "in_use": bool(cert.get("InUseBy")),
+        "storage": tags.get(STORAGE_TAG, ""),
+        "stored_serial": format(stored_cert.serial_number, "x") if managed_here else "",
+        "stored_not_after": stored_cert.not_valid_after_utc.isoformat() if managed_here else "",
+    }
+
+
+def load_report_stored_certificate(storage_method):
+    """
+    Load the stored certificate to join with the report.
+
+    Returns the certificate, or None if there is none, and whether the report
+    ran out of time before it could be read.
+    """
+    try:
+        stored = call_with_backoff("report", read_stored_certificate, storage_method)
+    except DeadlineExceeded as e:
+        print(f"WARN: Returning the report without the stored certificate: {e}")
+        return None, True
+    return (x509.load_pem_x509_certificate(stored, default_backend()) if stored else None), False
+
+
+def build_certificate_report(days, domains, storage_method, concurrency=8):
+    """
+    Build an expiry report of every ACM certificate expiring within ``days``.
+
+    Every ACM region the function imports into is covered. Certificates are
+    filtered on the expiry in the list summaries so only the candidates are
+    described, concurrently. The certificate managed by this function is
+    joined with the copy held in the configured storage backend.
+
+    Returns the rows and whether the report was truncated because the
+    invocation ran out of time.
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cutoff = now + datetime.timedelta(days=days)
+
+    described, truncated = describe_report_candidates(
+        {region: aws_client("acm", region) for region in acm_regions()}, cutoff, concurrency
+    )
+    stored_cert, stored_truncated = load_report_stored_certificate(storage_method)
+    env_domains = set(d.strip() for d in domains.split(","))
+
+    rows = [
+        report_row(
+            region,
+            cert,
+            tags,
+            stored_cert if certificate_domains(cert) == env_domains else None,
+            now,
+        )
+        for region, cert, tags in described
+        if cert.get("NotAfter") is not None and cert["NotAfter"] <= cutoff
+    ]
+    return sorted(rows, key=lambda row: row["not_after"]), truncated or stored_truncated
+
+
+def format_report(rows, report_format, truncated=False):
+    """Render report rows as a JSON document or CSV text."""
+    if report_format == "csv":
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+        return output.getvalue()
+    return json.dumps({"certificates": rows, "truncated": truncated})
+
+
+def run_report(event, storage_method):
+    """Build, log and return the expiry report requested by ``event``."""
+    # The descriptions retry individually, so the phase as a whole isn't retried
+    rows, truncated = run_phase(
+        "report",
+        build_certificate_report,
+        int(event.get("days", os.environ["REISSUE_DAYS"])),
+        os.environ["LETSENCRYPT_DOMAINS"],
+        storage_method,
+        int(event.get("concurrency", 8)),
+        retry=False,
+    )
+    report = format_report(rows, event.get("format", "json"), truncated)
+    print(report)
+    return report
+
+
+CHECKPOINT_NAME = "certbot-checkpoint.json"
+CHECKPOINT_PHASES = ["issued", "stored", "imported", "notified"]
+
+
+def save_checkpoint(storage_method, domains, phase, cert=None, certificate_arns=None):
+    """
+    Record the last completed issuance phase in the storage backend.
+
+    Until the certificate has been imported and notified the checkpoint also
+    holds the issued material, so a retried invocation can resume without a
+    new ACME order. The final checkpoint drops the material but keeps the
+    certificate ARN in each region.
+    """
+    checkpoint = {"domains": domains, "phase": phase}
+    if cert is not None and phase != "notified":
+        checkpoint.update({key: cert[key].decode("utf-8") for key in CERT_FILES})
+    if certificate_arns:
+        checkpoint["certificate_arns"] = certificate_arns
+    body = json.dumps(checkpoint)
+    print(f"INFO: Checkpointing issuance after the {phase} phase")
+
+    if storage_method == "s3":
+        aws_client("s3").put_object(
+            Bucket=os.environ["CERTIFICATE_BUCKET"],
+            Key=os.environ["OBJECT_PREFIX"] + CHECKPOINT_NAME,
+            Body=body,
+        )
+    elif storage_method == "secretsmanager":
+        store_secrets_in_secrets_manager(
+            {os.environ["CERTIFICATE_SECRET_PATH"] + CHECKPOINT_NAME: body}
+        )
+    elif storage_method == "ssm_secure":
+        put_param_args = {
+            "Name": os.environ["CERTIFICATE_PARAMETER_PATH"] + CHECKPOINT_NAME,
+            "Value": body,
+            "Type": "SecureString",
+            "Overwrite": True,
+            # The certificate, key and chain together can exceed a standard parameter
+            "Tier": "Intelligent-Tiering",
+        }
+
+        if "CUSTOM_KMS_KEY_ID" in os.environ:
+            put_param_args["KeyId"] = os.environ["CUSTOM_KMS_KEY_ID"]
+
+        aws_client("ssm").put_parameter(**put_param_args)
+    elif storage_method == "efs":
+        copy_to_efs(body.encode("utf-8"), "." + CHECKPOINT_NAME)
+
+
+def load_checkpoint(storage_method):
+    """Load the issuance checkpoint from the storage backend, or None if there is none."""
+    try:
+        if storage_method == "s3":
+            body = aws_client("s3").get_object(
+                Bucket=os.environ["CERTIFICATE_BUCKET"],
+                Key=os.environ["OBJECT_PREFIX"] + CHECKPOINT_NAME,
+            )["Body"].read()
+        elif storage_method == "secretsmanager":
+            body = aws_client("secretsmanager").get_secret_value(
+                SecretId=os.environ["CERTIFICATE_SECRET_PATH"] + CHECKPOINT_NAME
+            )["SecretString"]
+        elif storage_method == "ssm_secure":
+            params = aws_client("ssm").get_parameters(
+                Names=[os.environ["CERTIFICATE_PARAMETER_PATH"] + CHECKPOINT_NAME],
+                WithDecryption=True,
+            )["Parameters"]
+            body = params[0]["Value"] if params else None
+        elif storage_method == "efs":
+            path = pathlib.Path(
+                os.environ["EFS_PATH"] + "/" + os.environ["OBJECT_PREFIX"] + "/." + CHECKPOINT_NAME
+            )
+            body = path.read_bytes() if path.exists() else None
+        else:
+            body = None
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ["NoSuchKey", "ResourceNotFoundException"]:
+            return None
+        raise
+
+    return json.loads(body) if body else None
+
+
+def checkpoint_is_resumable(checkpoint, domains):
+    """
+    Check whether an unfinished checkpoint should be resumed.
+
+    A checkpoint for other domains, or whose certificate expires within
+    ``REISSUE_DAYS``, is discarded so a new certificate is issued instead.
+    """
+    if not checkpoint or checkpoint["domains"] != domains or checkpoint["phase"] == "notified":
+        return False
+
+    cert = x509.load_pem_x509_certificate(
+        checkpoint["certificate"].encode("utf-8"), default_backend()
+    )
+    now = datetime.datetime.now(datetime.timezone.utc)
+    reissue_days = int(os.environ["REISSUE_DAYS"])
+    if (cert.not_valid_after_utc - now).days <= reissue_days:
+        print(
+            f"INFO: Discarding the {checkpoint['phase']} checkpoint, "
+            f"its certificate expires within {reissue_days} days."
+        )
+        return False
+    return True
+
+
+def complete_issuance(cert, domains, storage_method, completed_phase, certificate_arns=None):
+    """Run every issuance phase after ``completed_phase``, checkpointing after each."""
+    completed = CHECKPOINT_PHASES.index(completed_phase)
+
+    if completed < CHECKPOINT_PHASES.index("stored"):
+        run_phase("store", store_cert, cert, storage_method)
+        save_checkpoint(storage_method, domains, "stored", cert)
+
+    if completed < CHECKPOINT_PHASES.index("imported"):
+        # A retried first import could create a duplicate certificate in ACM
+        certificate_arns = run_phase(
+            "import", upload_cert_to_acm, cert, domains, storage_method, retry=False
+        )
+        save_checkpoint(storage_method, domains, "imported", cert, certificate_arns)
+
+    if completed < CHECKPOINT_PHASES.index("notified"):
+        # The certificate is already in place, so a failing notification mustn't
+        # keep later runs resuming here instead of checking for renewal
+        try:
+            run_phase(
+                "notify",
+                notify_via_sns,
+                os.environ["NOTIFICATION_SNS_ARN"],
+                domains,
+                cert["certificate"],
+                certificate_arns,
+            )
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            print(f"WARN: Failed to send the notification, not retrying: {e}")
+        save_checkpoint(storage_method, domains, "notified", certificate_arns=certificate_arns)
+
+
+LOCK_NAME = "certbot.lock"
+
+
+def lock_ttl_seconds(context):
+    """Return how long a lock taken by this invocation stays valid."""
+    get_remaining = getattr(context, "get_remaining_time_in_millis", None)
+    # Outlive the invocation slightly, or fall back to the maximum Lambda timeout
+    return get_remaining() // 1000 + 60 if get_remaining else 900
 
-    print("CERTIFICATE_STORAGE: " + storage_method)
-    print("LETSENCRYPT_DOMAINS: " + os.environ["LETSENCRYPT_DOMAINS"])
-    print("LETSENCRYPT_EMAIL: " + os.environ["LETSENCRYPT_EMAIL"])
-    print("KEY_TYPE: " + os.environ["KEY_TYPE"])
-    print("PREFERRED_CHAIN: " + os.environ["PREFERRED_CHAIN"])
-    print("DRY_RUN: " + os.environ["DRY_RUN"])
 
-    # Check for required environment variables based on storage method
+def lock_is_expired(lock_body):
+    """Check whether a lock written by another invocation has expired."""
+    return json.loads(lock_body)["expires"] < time.time()
+
+
+def lock_is_owned(lock_body, owner):
+    """Check whether a lock was written by the given owner."""
+    return json.loads(lock_body)["owner"] == owner
+
+
+def acquire_s3_lock(key, lock_body):
+    """Take the lock with a conditional S3 write, replacing it only if expired."""
+    client = aws_client("s3")
+    bucket = os.environ["CERTIFICATE_BUCKET"]
+    try:
+        client.put_object(Bucket=bucket, Key=key, Body=lock_body, IfNoneMatch="*")
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ["PreconditionFailed", "ConditionalRequestConflict"]:
+            raise
+
+    current = client.get_object(Bucket=bucket, Key=key)
+    if not lock_is_expired(current["Body"].read()):
+        return False
+
+    # Only one invocation can replace the expired lock at this exact version
+    try:
+        client.put_object(Bucket=bucket, Key=key, Body=lock_body, IfMatch=current["ETag"])
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ["PreconditionFailed", "ConditionalRequestConflict"]:
+            raise
+        return False
+
+
+def release_s3_lock(key, owner):
+    """Delete the S3 lock if it is still held by the given owner."""
+    client = aws_client("s3")
+    bucket = os.environ["CERTIFICATE_BUCKET"]
+    try:
+        current = client.get_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "NoSuchKey":
+            return
+        raise
+    if lock_is_owned(current["Body"].read(), owner):
+        client.delete_object(Bucket=bucket, Key=key)
+
+
+def acquire_efs_lock(path, lock_body):
+    """Take the lock by exclusively creating a file, replacing it only if expired."""
+    for _ in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+        except FileExistsError:
+            try:
+                expired_body = pathlib.Path(path).read_bytes()
+            except FileNotFoundError:
+                # Released in the meantime, so try to create it again
+                continue
+            if not lock_is_expired(expired_body):
+                return False
+            # Renaming is atomic, so only one invocation moves the expired lock aside
+            expired_path = f"{path}.{uuid.uuid4()}.expired"
+            try:
+                os.rename(path, expired_path)
+            except FileNotFoundError:
+                return False
+            if pathlib.Path(expired_path).read_bytes() != expired_body:
+                # Another invocation took over after the expiry check, so its lock is put back
+                os.rename(expired_path, path)
+                return False
+            pathlib.Path(expired_path).unlink()
+            continue
+        with os.fdopen(fd, "w") as file:
+            file.write(lock_body)
+        return True
+    return False
+
+
+def release_efs_lock(path, owner):
+    """Delete the EFS lock file if it is still held by the given owner."""
+    try:
+        if lock_is_owned(pathlib.Path(path).read_bytes(), owner):
+            pathlib.Path(path).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def acquire_ssm_lock(name, lock_body):
+    """
+    Take the lock by creating a parameter, replacing it only if expired.
+
+    Parameter Store has no conditional overwrite, but every write adds exactly
+    one version. Of several invocations replacing the same expired lock, only
+    the one whose write lands directly on the expired version holds the lock.
+    The body of a later, losing write stays in place until it expires.
+    """
+    ssm = aws_client("ssm")
+    for _ in range(2):
+        try:
+            ssm.put_parameter(Name=name, Value=lock_body, Type="String", Overwrite=False)
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ParameterAlreadyExists":
+                raise
+
+        current = ssm.get_parameters(Names=[name])["Parameters"]
+        if not current:
+            # Released in the meantime, so try to create it again
+            continue
+        if not lock_is_expired(current[0]["Value"]):
+            return False
+        response = ssm.put_parameter(Name=name, Value=lock_body, Type="String", Overwrite=True)
+        return response["Version"] == current[0]["Version"] + 1
+    return False
+
+
+def release_ssm_lock(name, owner):
+    """Delete the lock parameter if it is still held by the given owner."""
+    ssm = aws_client("ssm")
+    current = ssm.get_parameters(Names=[name])["Parameters"]
+    if current and lock_is_owned(current[0]["Value"], owner):
+        try:
+            ssm.delete_parameter(Name=name)
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ParameterNotFound":
+                raise
+
+
+LOCK_PENDING_STAGE = "CERTBOT_LOCK_PENDING"
+
+
+def acquire_secrets_manager_lock(name, lock_body):
+    """
+    Take the lock by creating a secret, replacing it only if expired.
+
+    Secret deletion completes asynchronously, so the lock secret is never
+    deleted. An expired or released lock is replaced by writing a new version
+    under a pending stage and then moving ``AWSCURRENT`` from the expired
+    version to it. Moving the stage fails if another invocation moved it
+    first, so only one invocation takes over.
+    """
+    client = aws_client("secretsmanager")
+    try:
+        client.create_secret(Name=name, SecretString=lock_body)
+        return True
+    except ClientError as e:
+        # A lock deleted by an earlier release may still be scheduled for deletion
+        if e.response["Error"]["Code"] == "InvalidRequestException":
+            return False
+        if e.response["Error"]["Code"] != "ResourceExistsException":
+            raise
+
+    current = client.get_secret_value(SecretId=name, VersionStage="AWSCURRENT")
+    if not lock_is_expired(current["SecretString"]):
+        return False
+    return replace_secrets_manager_lock(client, name, lock_body, current["VersionId"])
+
+
+def replace_secrets_manager_lock(client, name, lock_body, expected_version_id):
+    """Replace the lock secret only if ``expected_version_id`` is still its current version."""
+    version_id = str(uuid.uuid4())
+    client.put_secret_value(
+        SecretId=name,
+        SecretString=lock_body,
+        ClientRequestToken=version_id,
+        VersionStages=[LOCK_PENDING_STAGE],
+    )
+    try:
+        client.update_secret_version_stage(
+            SecretId=name,
+            VersionStage="AWSCURRENT",
+            MoveToVersionId=version_id,
+            RemoveFromVersionId=expected_version_id,
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in [
+            "InvalidParameterException",
+            "InvalidRequestException",
+        ]:
+            raise
+        return False
+    return True
+
+
+def release_secrets_manager_lock(name, owner):
+    """Mark the lock secret as released if it is still held by the given owner."""
+    client = aws_client("secretsmanager")
+    try:
+        current = client.get_secret_value(SecretId=name, VersionStage="AWSCURRENT")
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ["ResourceNotFoundException", "InvalidRequestException"]:
+            return
+        raise
+    if lock_is_owned(current["SecretString"], owner):
+        released = json.dumps({"owner": None, "expires": 0})
+        replace_secrets_manager_lock(client, name, released, current["VersionId"])
+
+
+def lock_location(storage_method):
+    """Return the acquire and release functions and lock name for a storage backend."""
+    if storage_method == "s3":
+        return acquire_s3_lock, release_s3_lock, os.environ["OBJECT_PREFIX"] + LOCK_NAME
+    if storage_method == "secretsmanager":
+        return (
+            acquire_secrets_manager_lock,
+            release_secrets_manager_lock,
+            os.environ["CERTIFICATE_SECRET_PATH"] + LOCK_NAME,
+        )
+    if storage_method == "ssm_secure":
+        return (
+            acquire_ssm_lock,
+            release_ssm_lock,
+            os.environ["CERTIFICATE_PARAMETER_PATH"] + LOCK_NAME,
+        )
+    if storage_method == "efs":
+        directory = os.environ["EFS_PATH"] + "/" + os.environ["OBJECT_PREFIX"]
+        pathlib.Path(directory).mkdir(parents=True, exist_ok=True)
+        return acquire_efs_lock, release_efs_lock, directory + "/." + LOCK_NAME
+    raise ValueError(f"Unknown storage method {storage_method}")
+
+
+def acquire_lock(storage_method, owner, ttl):
+    """
+    Take the issuance lock in the storage backend.
+
+    Returns False if another invocation holds an unexpired lock.
+    """
+    acquire, _release, name = lock_location(storage_method)
+    lock_body = json.dumps({"owner": owner, "expires": int(time.time()) + ttl})
+    return acquire(name, lock_body)
+
+
+def release_lock(storage_method, owner):
+    """Release the issuance lock if it is still held by the given owner."""
+    _acquire, release, name = lock_location(storage_method)
+    release(name, owner)
+
+
+def check_storage_settings(storage_method):
+    """Check that the environment variables required by the storage method are set."""
     if storage_method == "s3" and "CERTIFICATE_BUCKET" not in os.environ:
         raise ValueError("S3 storage selected but CERTIFICATE_BUCKET is not set")
     if (
@@ -324,27 +1355,74 @@ def handler(_event, _context):
     if storage_method == "efs" and "EFS_PATH" not in os.environ:
         raise ValueError("EFS storage selected but EFS_PATH is not set")
 
+
+def handler(event, context):
+    """Lambda function handler."""
+    start_deadline(context)
+    # A warm container must not reuse the ACM scan of an earlier, failed invocation
+    find_existing_cert.cache_clear()
+    storage_method = os.getenv("CERTIFICATE_STORAGE", "s3").lower()
+
+    print("CERTIFICATE_STORAGE: " + storage_method)
+    print("LETSENCRYPT_DOMAINS: " + os.environ["LETSENCRYPT_DOMAINS"])
+    print("LETSENCRYPT_EMAIL: " + os.environ["LETSENCRYPT_EMAIL"])
+    print("KEY_TYPE: " + os.environ["KEY_TYPE"])
+    print("PREFERRED_CHAIN: " + os.environ["PREFERRED_CHAIN"])
+    print("DRY_RUN: " + os.environ["DRY_RUN"])
+
+    check_storage_settings(storage_method)
+    key_profile(os.environ["KEY_TYPE"])
+
     # For EFS, we need the directory to exist.
     # We don't require it to be a real mount point because that breaks tests.
     if storage_method == "efs" and not os.path.isdir(os.environ["EFS_PATH"]):
         raise ValueError("EFS storage selected but EFS_PATH is not a directory")
 
-    domains = os.environ["LETSENCRYPT_DOMAINS"]
-    if should_provision(domains):
-        cert = provision_cert(
-            os.environ["LETSENCRYPT_EMAIL"],
-            domains,
-            storage_method,
-            os.environ["KEY_TYPE"],
-        )
-        if not os.getenv("DRY_RUN", "False").lower() in ["true", "1"]:
-            upload_cert_to_acm(cert, domains)
-            notify_via_sns(
-                os.environ["NOTIFICATION_SNS_ARN"],
+    # Reports only read ACM and the storage backend, so they don't take the lock
+    event = event or {}
+    if event.get("mode") == "report":
+        return run_report(event, storage_method)
+
+    dry_run = os.getenv("DRY_RUN", "False").lower() in ["true", "1"]
+    owner = getattr(context, "aws_request_id", None) or str(uuid.uuid4())
+    if not dry_run and not acquire_lock(storage_method, owner, lock_ttl_seconds(context)):
+        print("INFO: Another invocation is already issuing this certificate, exiting.")
+        return
+
+    try:
+        domains = os.environ["LETSENCRYPT_DOMAINS"]
+        checkpoint = None if dry_run else run_phase("scan", load_checkpoint, storage_method)
+        if checkpoint_is_resumable(checkpoint, domains):
+            print(f"INFO: Resuming issuance after the {checkpoint['phase']} phase.")
+            cert = {key: checkpoint[key].encode("utf-8") for key in CERT_FILES}
+            complete_issuance(
+                cert,
                 domains,
-                cert["certificate"],
+                storage_method,
+                checkpoint["phase"],
+                checkpoint.get("certificate_arns"),
             )
-        else:
-            print(
-                "WARN: Dry run was used so ACM import and storage upload arent tested."
+        elif run_phase("scan", should_provision, domains):
+            # Certbot places a new ACME order on every attempt, so it isn't retried here
+            cert = run_phase(
+                "issue",
+                provision_cert,
+                os.environ["LETSENCRYPT_EMAIL"],
+                domains,
+                storage_method,
+                os.environ["KEY_TYPE"],
+                retry=False,
             )
+            if not dry_run:
+                complete_issuance(cert, domains, storage_method, "issued")
+            else:
+                print(
+                    "WARN: Dry run was used so ACM import and storage upload arent tested."
+                )
+    except DeadlineExceeded as e:
+        # Raising lets Lambda retry the invocation, which resumes from the checkpoint
+        print(f"WARN: Stopping before the function times out: {e}")
+        raise
+    finally:
+        if not dry_run:
+            release_lock(storage_method, owner)
@@ -0,0 +1,263 @@
+"""
+Read the certificates written by the Certbot function, with a local cache.
+
+Hosts that consume the certificates call ``fetch_certificate`` on a schedule.
+Each call revalidates the cached copy with a cheap request to the storage
+backend and only downloads the certificate, key and chain when they changed:
+
+- S3 compares the ``serial`` metadata from HeadObject requests, falling back
+  to the ETags for objects written without metadata. While the function is
+  part way through rewriting the objects their serials differ, and the cached
+  copy is kept until they match again.
+- Secrets Manager compares the version ID of the ``AWSCURRENT`` stage.
+- Parameter Store compares the parameter versions, read without decryption.
+- EFS compares the size and modification time. When they differ the files
+  are read, and they only count as changed if their SHA-256 digest differs.
+
+Secrets Manager, Parameter Store and EFS store the files one at a time. After
+all three the function writes a manifest with their SHA-256 digest, and files
+that don't match it are still being rewritten, so the cached copy is kept.
+Files stored without a manifest are accepted as they are.
+
+This module only depends on boto3, so it can be copied onto hosts that don't
+have certbot installed.
+
+Usage:
+
+    cert, changed = fetch_certificate("s3", "my-cert-bucket", "/var/cache/certbot")
+    if changed:
+        reload_web_server()
+"""
+
+import hashlib
+import json
+import os
+import pathlib
+from functools import partial
+
+import boto3
+
+# The files written by the function, as in ``CERT_FILES`` in index.py
+CERT_FILES = {
+    "certificate": "cert.pem",
+    "private_key": "privkey.pem",
+    "certificate_chain": "chain.pem",
+}
+# Written by the function after the files, as ``MANIFEST_NAME`` in index.py
+MANIFEST_NAME = "certbot-manifest.json"
+STATE_FILE = "state.json"
+
+
+def cache_directory(cache_dir, storage_method, location, prefix):
+    """Return the cache directory for one storage location."""
+    digest = hashlib.sha256(f"{storage_method}:{location}:{prefix}".encode("utf-8"))
+    return pathlib.Path(cache_dir) / digest.hexdigest()[:16]
+
+
+def load_cache(directory):
+    """Load the cached validator and files, or (None, None) if the cache is missing."""
+    try:
+        state = json.loads((directory / STATE_FILE).read_text())
+        files = {key: (directory / name).read_bytes() for key, name in CERT_FILES.items()}
+    except (FileNotFoundError, ValueError):
+        return None, None
+    return state, files
+
+
+def save_cache(directory, state, files):
+    """Write the files and validator, replacing each file atomically."""
+    directory.mkdir(parents=True, exist_ok=True, mode=0o700)
+    for key, name in CERT_FILES.items():
+        write_private(directory / name, files[key])
+    # The state is written last, so an interrupted save is never treated as valid
+    write_private(directory / STATE_FILE, json.dumps(state).encode("utf-8"))
+
+
+def write_private(path, contents):
+    """Write a file readable only by the owner, via a temporary file and rename."""
+    temporary = path.with_name(f".{path.name}.tmp")
+    descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, "wb") as file:
+        file.write(contents)
+    os.replace(temporary, path)
+
+
+def s3_state(responses):
+    """
+    Return the validator for HeadObject or GetObject responses of the three files.
+
+    Returns None when the serials differ, because the function is still
+    writing a new certificate and its key and chain.
+    """
+    serials = {r.get("Metadata", {}).get("serial") for r in responses.values()}
+    if serials == {None}:
+        return {"etags": {name: r["ETag"] for name, r in responses.items()}}
+    if len(serials) > 1:
+        return None
+    return {"serial": serials.pop()}
+
+
+def s3_validator(client, bucket, prefix):
+    """Return the serial shared by the stored files, from their metadata, or their ETags."""
+    return s3_state({
+        name: client.head_object(Bucket=bucket, Key=prefix + name)
+        for name in CERT_FILES.values()
+    })
+
+
+def s3_files(client, bucket, prefix, state):
+    """
+    Download the certificate files from S3.
+
+    Returns None if the downloaded files don't all match ``state``, because
+    they were rewritten after it was read.
+    """
+    responses = {
+        name: client.get_object(Bucket=bucket, Key=prefix + name)
+        for name in CERT_FILES.values()
+    }
+    if s3_state(responses) != state:
+        return None
+    return {key: responses[name]["Body"].read() for key, name in CERT_FILES.items()}
+
+
+def secrets_manager_validator(client, path):
+    """Return the current version ID of each secret."""
+    versions = {}
+    for name in CERT_FILES.values():
+        stages = client.describe_secret(SecretId=path + name)["VersionIdsToStages"]
+        versions[name] = next(
+            version for version, labels in stages.items() if "AWSCURRENT" in labels
+        )
+    return {"versions": versions}
+
+
+def files_digest(files):
+    """Return a SHA-256 digest of the certificate files."""
+    digest = hashlib.sha256()
+    for key in CERT_FILES:
+        digest.update(files[key])
+    return digest.hexdigest()
+
+
+def matches_manifest(files, manifest):
+    """
+    Check the files against the manifest the function wrote after them.
+
+    Returns None when they don't match, because the function is still writing
+    a new certificate and its key and chain, and otherwise the files.
+    """
+    if manifest is not None and json.loads(manifest)["digest"] != files_digest(files):
+        return None
+    return files
+
+
+def secrets_manager_files(client, path):
+    """Read the certificate files from Secrets Manager, or None if mid-rewrite."""
+    files = {
+        key: client.get_secret_value(SecretId=path + name)["SecretString"].encode("utf-8")
+        for key, name in CERT_FILES.items()
+    }
+    try:
+        manifest = client.get_secret_value(SecretId=path + MANIFEST_NAME)["SecretString"]
+    except client.exceptions.ResourceNotFoundException:
+        manifest = None
+    return matches_manifest(files, manifest)
+
+
+def parameter_store_validator(client, path):
+    """Return the version of each parameter, without decrypting the values."""
+    names = [path + name for name in CERT_FILES.values()]
+    response = client.get_parameters(Names=names, WithDecryption=False)
+    if response["InvalidParameters"]:
+        raise FileNotFoundError(f"Parameters not found: {response['InvalidParameters']}")
+    return {"versions": {p["Name"]: p["Version"] for p in response["Parameters"]}}
+
+
+def parameter_store_files(client, path):
+    """Read and decrypt the certificate files from Parameter Store, or None if mid-rewrite."""
+    names = [path + name for name in [*CERT_FILES.values(), MANIFEST_NAME]]
+    response = client.get_parameters(Names=names, WithDecryption=True)
+    values = {p["Name"]: p["Value"] for p in response["Parameters"]}
+    files = {key: values[path + name].encode("utf-8") for key, name in CERT_FILES.items()}
+    return matches_manifest(files, values.get(path + MANIFEST_NAME))
+
+
+def efs_stats(directory):
+    """Return the size and modification time of each file."""
+    stats = {}
+    for name in CERT_FILES.values():
+        stat = (directory / name).stat()
+        stats[name] = [stat.st_size, stat.st_mtime_ns]
+    return stats
+
+
+def efs_files(directory):
+    """Read the certificate files from EFS, or None if mid-rewrite."""
+    files = {key: (directory / name).read_bytes() for key, name in CERT_FILES.items()}
+    try:
+        manifest = (directory / ("." + MANIFEST_NAME)).read_bytes()
+    except FileNotFoundError:
+        manifest = None
+    return matches_manifest(files, manifest)
+
+
+def rewritten(cached_files, location):
+    """Return the consistent cached copy while the stored files are being rewritten."""
+    if cached_files is None:
+        raise RuntimeError(f"The certificate in {location} is being rewritten, try again")
+    return cached_files, False
+
+
+def fetch_certificate(storage_method, location, cache_dir, prefix="", client=None):
+    """
+    Return the certificate, private key and chain, and whether they changed.
+
+    ``storage_method`` is one of ``s3``, ``secretsmanager``, ``ssm_secure`` and
+    ``efs``. ``location`` is the bucket name, the secret or parameter path, or
+    the EFS mount path, matching ``CERTIFICATE_BUCKET``,
+    ``CERTIFICATE_SECRET_PATH``, ``CERTIFICATE_PARAMETER_PATH`` and
+    ``EFS_PATH`` on the function. ``prefix`` is its ``OBJECT_PREFIX``, used by
+    S3 and EFS. The material is cached below ``cache_dir``, and ``changed`` is
+    False when the cached copy is still current.
+    """
+    directory = cache_directory(cache_dir, storage_method, location, prefix)
+    cached_state, cached_files = load_cache(directory)
+
+    if storage_method == "s3":
+        client = client or boto3.client("s3")
+        state = s3_validator(client, location, prefix)
+        download = partial(s3_files, client, location, prefix, state)
+    elif storage_method == "secretsmanager":
+        client = client or boto3.client("secretsmanager")
+        state = secrets_manager_validator(client, location)
+        download = partial(secrets_manager_files, client, location)
+    elif storage_method == "ssm_secure":
+        client = client or boto3.client("ssm")
+        state = parameter_store_validator(client, location)
+        download = partial(parameter_store_files, client, location)
+    elif storage_method == "efs":
+        efs_directory = pathlib.Path(location + "/" + prefix)
+        stats = efs_stats(efs_directory)
+        if cached_files is not None and stats == cached_state.get("stats"):
+            return cached_files, False
+
+        files = efs_files(efs_directory)
+        if files is None:
+            return rewritten(cached_files, location)
+        # Files rewritten with the same contents are recorded but don't count as changed
+        state = {"stats": stats, "digest": files_digest(files)}
+        save_cache(directory, state, files)
+        return files, cached_files is None or state["digest"] != cached_state.get("digest")
+    else:
+        raise ValueError(f"Unknown storage method: {storage_method}")
+
+    if cached_files is not None and state == cached_state:
+        return cached_files, False
+
+    files = download() if state is not None else None
+    if files is None:
+        return rewritten(cached_files, location)
+
+    save_cache(directory, state, files)
+    return files, True
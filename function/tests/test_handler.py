@@ -1,6 +1,8 @@
 """Test driver for the lambda."""
 import os
 import sys
+import json
+import time
 import datetime
 import pathlib
 from unittest.mock import patch, mock_open, MagicMock
@@ -9,6 +11,8 @@ import pytest
 import boto3
 from moto import mock_aws
 from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import src.index as index # pylint: disable=wrong-import-position
@@ -192,6 +196,8 @@ def test_provision_cert_creates_objects_correctly_for_s3_storage(
             "example.com",
             "--key-type",
             "ecdsa",
+            "--elliptic-curve",
+            "secp256r1",
             "--config-dir",
             "/tmp/config-dir/",
             "--work-dir",
@@ -271,6 +277,8 @@ def test_provision_cert_creates_secrets_correctly_for_secretsmanager_storage(
             "example.com",
             "--key-type",
             "ecdsa",
+            "--elliptic-curve",
+            "secp256r1",
             "--config-dir",
             "/tmp/config-dir/",
             "--work-dir",
@@ -347,6 +355,8 @@ def test_provision_cert_behaves_correctly_for_ssm_storage(
             "example.com",
             "--key-type",
             "ecdsa",
+            "--elliptic-curve",
+            "secp256r1",
             "--config-dir",
             "/tmp/config-dir/",
             "--work-dir",
@@ -445,6 +455,8 @@ def test_provision_cert_behaves_correctly_for_efs_storage(
             "example.com",
             "--key-type",
             "ecdsa",
+            "--elliptic-curve",
+            "secp256r1",
             "--config-dir",
             "/tmp/config-dir/",
             "--work-dir",
@@ -471,6 +483,7 @@ def test_provision_cert_behaves_correctly_for_efs_storage(
         assert contents == b"data"
 
 
+@mock_aws
 @patch("certbot.main.main")
 def test_provision_cert_respects_dry_run_env_var(mock_certbot_main):
     """Test function respects DRY_RUN environment variable."""
@@ -500,6 +513,8 @@ def test_provision_cert_respects_dry_run_env_var(mock_certbot_main):
             "example.com",
             "--key-type",
             "ecdsa",
+            "--elliptic-curve",
+            "secp256r1",
             "--config-dir",
             "/tmp/config-dir/",
             "--work-dir",
@@ -571,6 +586,8 @@ def test_provision_reissues_if_san_changed(
             "example.com, www.example.com, api.example.com",
             "--key-type",
             "ecdsa",
+            "--elliptic-curve",
+            "secp256r1",
             "--config-dir",
             "/tmp/config-dir/",
             "--work-dir",
@@ -581,3 +598,608 @@ def test_provision_reissues_if_san_changed(
             "ISRG Root X1",
         ]
     )
+
+
+def test_key_profiles_map_to_certbot_arguments_and_acm_key_types():
+    """Test profiles select the key size or curve and are validated."""
+    assert index.key_profile("rsa3072") == {
+        "certbot": ["--key-type", "rsa", "--rsa-key-size", "3072"],
+        "acm": "RSA_3072",
+    }
+    assert index.key_profile("ECDSA") == index.key_profile("ecdsa-p256")
+
+    os.environ["KEY_TYPE"] = "ecdsa-p521"
+    with pytest.raises(ValueError) as e:
+        index.handler({}, {})
+    assert "KEY_TYPE ecdsa-p521 is not one of" in str(e.value)
+
+
+@mock_aws
+def test_existing_cert_scan_only_lists_the_profile_key_type():
+    """Test the ACM scan is narrowed to the configured key type."""
+    index.find_existing_cert.cache_clear()
+    os.environ["KEY_TYPE"] = "ecdsa-p384"
+    with patch("src.index.list_acm_certificates", wraps=index.list_acm_certificates) as mock_list:
+        assert index.find_existing_cert("example.com") is None
+
+    assert mock_list.call_args.kwargs["key_types"] == ["EC_secp384r1"]
+    index.find_existing_cert.cache_clear()
+
+
+def test_secrets_manager_writer_only_updates_existing_secrets(aws_mock):
+    """Test existing secrets are updated without a failed create call first."""
+    secrets_client = boto3.client("secretsmanager")
+    secrets_client.create_secret(Name="/example/path/cert.pem", SecretString="old")
+
+    with patch("src.index.boto3.client", return_value=secrets_client):
+        with patch.object(
+            secrets_client, "create_secret", wraps=secrets_client.create_secret
+        ) as mock_create:
+            index.store_secrets_in_secrets_manager({
+                "/example/path/cert.pem": "new",
+                "/example/path/chain.pem": "chain",
+            })
+
+    mock_create.assert_called_once_with(
+        Name="/example/path/chain.pem", SecretString="chain"
+    )
+    response = secrets_client.get_secret_value(SecretId="/example/path/cert.pem")
+    assert response["SecretString"] == "new"
+    response = secrets_client.get_secret_value(SecretId="/example/path/chain.pem")
+    assert response["SecretString"] == "chain"
+
+
+def test_parameter_store_writer_skips_unchanged_parameters(aws_mock):
+    """Test unchanged parameters are not rewritten."""
+    ssm_client = boto3.client("ssm")
+    ssm_client.put_parameter(
+        Name="/example/path/cert.pem", Value="same", Type="SecureString"
+    )
+
+    with patch("src.index.boto3.client", return_value=ssm_client):
+        with patch.object(
+            ssm_client, "put_parameter", wraps=ssm_client.put_parameter
+        ) as mock_put:
+            index.store_parameters_in_parameter_store({
+                "/example/path/cert.pem": "same",
+                "/example/path/chain.pem": "chain",
+            })
+
+    mock_put.assert_called_once()
+    assert mock_put.call_args.kwargs["Name"] == "/example/path/chain.pem"
+    response = ssm_client.get_parameter(
+        Name="/example/path/chain.pem", WithDecryption=True
+    )
+    assert response["Parameter"]["Value"] == "chain"
+
+
+def test_s3_objects_carry_certificate_metadata_and_bundle(aws_mock):
+    """Test S3 uploads set metadata, a checksum and the optional combined bundle."""
+    s3_client = boto3.client("s3")
+    s3_client.create_bucket(Bucket="example-cert-bucket")
+    cert = {
+        "certificate": MOCK_CERTIFICATE,
+        "private_key": MOCK_PRIVATE_KEY,
+        "certificate_chain": b"chain\n",
+    }
+
+    with patch.dict(os.environ, {"COMBINED_BUNDLE": "True"}):
+        with patch("src.index.boto3.client", return_value=s3_client):
+            with patch.object(
+                s3_client, "put_object", wraps=s3_client.put_object
+            ) as mock_put:
+                index.store_cert(cert, "s3")
+
+    checksums = {
+        call.kwargs["Key"]: call.kwargs["ChecksumSHA256"]
+        for call in mock_put.call_args_list
+    }
+    assert set(checksums) == {"cert.pem", "privkey.pem", "chain.pem", "bundle.pem"}
+    assert all(checksums.values())
+
+    response = s3_client.head_object(Bucket="example-cert-bucket", Key="privkey.pem")
+    assert response["ContentType"] == "application/x-pem-file"
+    assert response["Metadata"] == index.certificate_metadata(MOCK_CERTIFICATE)
+    assert response["Metadata"]["not-after"] == "2024-11-11T22:41:27+00:00"
+
+    obj = s3_client.get_object(Bucket="example-cert-bucket", Key="bundle.pem")
+    assert obj["Body"].read() == MOCK_CERTIFICATE.rstrip(b"\n") + b"\nchain\n" + MOCK_PRIVATE_KEY
+
+
+@mock_aws
+@patch("certbot.main.main")
+def test_handler_exits_early_if_another_invocation_holds_the_lock(mock_certbot_main):
+    """Test a run that loses the lock race does not issue a certificate."""
+    mock_s3_client = boto3.client("s3")
+    mock_s3_client.create_bucket(Bucket="example-cert-bucket")
+    mock_s3_client.put_object(
+        Bucket="example-cert-bucket",
+        Key="certbot.lock",
+        Body=json.dumps({"owner": "other", "expires": time.time() + 600}),
+    )
+
+    index.handler({}, {})
+
+    mock_certbot_main.assert_not_called()
+    obj = mock_s3_client.get_object(Bucket="example-cert-bucket", Key="certbot.lock")
+    assert json.loads(obj["Body"].read())["owner"] == "other"
+
+
+def test_expired_lock_is_taken_over(aws_mock):
+    """Test a lock left behind by a failed invocation is replaced once expired."""
+    mock_s3_client = boto3.client("s3")
+    mock_s3_client.create_bucket(Bucket="example-cert-bucket")
+    mock_s3_client.put_object(
+        Bucket="example-cert-bucket",
+        Key="certbot.lock",
+        Body=json.dumps({"owner": "other", "expires": time.time() - 1}),
+    )
+
+    assert index.acquire_lock("s3", "me", 600)
+    assert not index.acquire_lock("s3", "someone-else", 600)
+
+    index.release_lock("s3", "me")
+    response = mock_s3_client.list_objects_v2(Bucket="example-cert-bucket")
+    assert "Contents" not in response
+
+
+def test_only_one_invocation_takes_over_an_expired_ssm_lock(aws_mock):
+    """Test a takeover loses if another write lands on the expired version first."""
+    ssm_client = boto3.client("ssm")
+    ssm_client.put_parameter(
+        Name="/example/path/certbot.lock",
+        Value=json.dumps({"owner": "other", "expires": time.time() - 1}),
+        Type="String",
+    )
+    get_parameters = ssm_client.get_parameters
+
+    def read_then_race(**kwargs):
+        response = get_parameters(**kwargs)
+        ssm_client.put_parameter(
+            Name="/example/path/certbot.lock",
+            Value=json.dumps({"owner": "racer", "expires": time.time() + 600}),
+            Type="String",
+            Overwrite=True,
+        )
+        return response
+
+    os.environ["CERTIFICATE_PARAMETER_PATH"] = "/example/path/"
+    with patch("src.index.boto3.client", return_value=ssm_client):
+        with patch.object(ssm_client, "get_parameters", side_effect=read_then_race):
+            assert not index.acquire_lock("ssm_secure", "me", 600)
+        ssm_client.put_parameter(
+            Name="/example/path/certbot.lock",
+            Value=json.dumps({"owner": "racer", "expires": time.time() - 1}),
+            Type="String",
+            Overwrite=True,
+        )
+        assert index.acquire_lock("ssm_secure", "me", 600)
+        index.release_lock("ssm_secure", "me")
+        # Releasing a lock that is already gone is not an error
+        index.release_lock("ssm_secure", "me")
+
+
+def test_only_one_invocation_takes_over_an_expired_efs_lock(tmp_path):
+    """Test a takeover loses if another invocation replaces the expired file first."""
+    lock_path = tmp_path / ".certbot.lock"
+    lock_path.write_text(json.dumps({"owner": "other", "expires": time.time() - 1}))
+    lock_is_expired = index.lock_is_expired
+    raced = []
+
+    def check_then_race(lock_body):
+        expired = lock_is_expired(lock_body)
+        if not raced:
+            raced.append(True)
+            racer_body = json.dumps({"owner": "racer", "expires": time.time() + 600})
+            assert index.acquire_efs_lock(str(lock_path), racer_body)
+        return expired
+
+    with patch("src.index.lock_is_expired", side_effect=check_then_race):
+        assert not index.acquire_efs_lock(
+            str(lock_path), json.dumps({"owner": "me", "expires": time.time() + 600})
+        )
+
+    assert json.loads(lock_path.read_text())["owner"] == "racer"
+    assert [path.name for path in tmp_path.iterdir()] == [".certbot.lock"]
+
+
+def test_expired_secrets_manager_lock_is_taken_over_once(aws_mock):
+    """Test an expired secret lock is replaced without deleting the secret."""
+    secrets_client = boto3.client("secretsmanager")
+    secrets_client.create_secret(
+        Name="/example/path/certbot.lock",
+        SecretString=json.dumps({"owner": "other", "expires": time.time() - 1}),
+    )
+    stale = secrets_client.get_secret_value(SecretId="/example/path/certbot.lock")
+
+    os.environ["CERTIFICATE_SECRET_PATH"] = "/example/path/"
+    with patch("src.index.boto3.client", return_value=secrets_client):
+        assert index.acquire_lock("secretsmanager", "me", 600)
+        assert not index.acquire_lock("secretsmanager", "someone-else", 600)
+        # An invocation that read the expired lock before the takeover loses
+        assert not index.replace_secrets_manager_lock(
+            secrets_client, "/example/path/certbot.lock", "{}", stale["VersionId"]
+        )
+
+        index.release_lock("secretsmanager", "me")
+        assert index.acquire_lock("secretsmanager", "someone-else", 600)
+
+    current = secrets_client.get_secret_value(
+        SecretId="/example/path/certbot.lock", VersionStage="AWSCURRENT"
+    )
+    assert json.loads(current["SecretString"])["owner"] == "someone-else"
+
+
+def test_releasing_a_missing_lock_is_not_an_error(aws_mock):
+    """Test release doesn't raise from the handler's finally block when the lock is gone."""
+    boto3.client("s3").create_bucket(Bucket="example-cert-bucket")
+    index.release_lock("s3", "me")
+    index.release_lock("efs", "me")
+
+
+def self_signed_certificate(domain, days):
+    """Build a self-signed certificate and key for ``domain`` valid for ``days``."""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(x509.NameOID.COMMON_NAME, domain)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=days))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName(domain)]), critical=False)
+        .sign(key, hashes.SHA256())
+    )
+    return {
+        "certificate": cert.public_bytes(serialization.Encoding.PEM),
+        "private_key": key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        ),
+        "certificate_chain": cert.public_bytes(serialization.Encoding.PEM),
+    }
+
+
+@mock_aws
+def test_certificate_is_imported_and_checked_in_every_region():
+    """Test one issuance is imported into each ACM region and each region is checked."""
+    index.find_existing_cert.cache_clear()
+    cert = self_signed_certificate("example.com", 90)
+    eu_client = boto3.client("acm", region_name="eu-west-1")
+    existing_arn = eu_client.import_certificate(
+        Certificate=cert["certificate"],
+        PrivateKey=cert["private_key"],
+        CertificateChain=cert["certificate_chain"],
+    )["CertificateArn"]
+
+    with patch.dict(os.environ, {"ACM_REGIONS": "us-east-1, eu-west-1"}):
+        # The certificate is missing in us-east-1
+        assert index.should_provision("example.com")
+        assert not index.region_needs_certificate("example.com", "eu-west-1")
+
+        arns = index.upload_cert_to_acm(cert, "example.com", "s3")
+
+    assert set(arns) == {"us-east-1", "eu-west-1"}
+    assert arns["eu-west-1"] == existing_arn
+    assert arns["us-east-1"].startswith("arn:aws:acm:us-east-1:")
+    us_client = boto3.client("acm", region_name="us-east-1")
+    tags = us_client.list_tags_for_certificate(CertificateArn=arns["us-east-1"])["Tags"]
+    assert {"Key": "certbot:storage", "Value": "s3://example-cert-bucket/"} in tags
+    index.find_existing_cert.cache_clear()
+
+
+@mock_aws
+def test_notifications_are_summarized_with_structured_attributes():
+    """Test one summary message covers every certificate, with JSON attributes."""
+    client = boto3.client("sns")
+    topic_arn = client.create_topic(Name="example-topic")["TopicArn"]
+    notifications = [
+        index.certificate_notification(
+            "example.com",
+            self_signed_certificate("example.com", 90)["certificate"],
+            {"us-east-1": "arn:aws:acm:us-east-1:123456789012:certificate/1"},
+        ),
+        index.certificate_notification(
+            "example.org", self_signed_certificate("example.org", 90)["certificate"]
+        ),
+    ]
+
+    with patch("src.index.boto3.client", return_value=client):
+        with patch.object(client, "publish", wraps=client.publish) as mock_publish:
+            index.publish_notifications(topic_arn, notifications)
+
+    mock_publish.assert_called_once()
+    kwargs = mock_publish.call_args.kwargs
+    assert kwargs["Subject"] == "Issued 2 new LetsEncrypt certificates"
+    assert "ACM (us-east-1): arn:aws:acm:us-east-1:123456789012:certificate/1" in kwargs["Message"]
+    attributes = kwargs["MessageAttributes"]
+    assert json.loads(attributes["domains"]["StringValue"]) == ["example.com", "example.org"]
+    assert json.loads(attributes["regions"]["StringValue"]) == ["us-east-1"]
+    certificates = json.loads(attributes["certificates"]["StringValue"])
+    assert [c["serial"] for c in certificates] == [n["serial"] for n in notifications]
+
+    with patch.dict(os.environ, {"NOTIFICATION_MODE": "per_certificate"}):
+        with patch("src.index.boto3.client", return_value=client):
+            with patch.object(client, "publish_batch", wraps=client.publish_batch) as mock_batch:
+                index.publish_notifications(topic_arn, notifications * 6)
+
+    assert [len(c.kwargs["PublishBatchRequestEntries"]) for c in mock_batch.call_args_list] == [10, 2]
+
+
+@mock_aws
+def test_report_mode_lists_expiring_certificates_with_storage_details():
+    """Test report mode joins ACM certificates with the stored certificate."""
+    acm_client = boto3.client("acm")
+    managed_arn = acm_client.request_certificate(
+        DomainName="example.com", SubjectAlternativeNames=["example.com"]
+    )["CertificateArn"]
+    acm_client.add_tags_to_certificate(
+        CertificateArn=managed_arn,
+        Tags=[{"Key": "certbot:storage", "Value": "s3://example-cert-bucket/"}],
+    )
+    boto3.client("acm", region_name="eu-west-1").request_certificate(
+        DomainName="other.com", SubjectAlternativeNames=["other.com"]
+    )
+
+    mock_s3_client = boto3.client("s3")
+    mock_s3_client.create_bucket(Bucket="example-cert-bucket")
+    mock_s3_client.put_object(
+        Bucket="example-cert-bucket", Key="cert.pem", Body=MOCK_CERTIFICATE
+    )
+
+    with patch.dict(os.environ, {"ACM_REGIONS": "us-east-1,eu-west-1"}):
+        report = json.loads(index.handler({"mode": "report", "days": 400}, {}))
+    rows = {row["domain_name"]: row for row in report["certificates"]}
+
+    assert set(rows) == {"example.com", "other.com"}
+    assert rows["example.com"]["storage"] == "s3://example-cert-bucket/"
+    assert rows["example.com"]["region"] == "us-east-1"
+    assert rows["other.com"]["region"] == "eu-west-1"
+    stored = x509.load_pem_x509_certificate(MOCK_CERTIFICATE)
+    assert rows["example.com"]["stored_serial"] == format(stored.serial_number, "x")
+    assert rows["other.com"]["storage"] == ""
+    assert rows["other.com"]["stored_serial"] == ""
+
+    csv_report = index.handler({"mode": "report", "days": 30, "format": "csv"}, {})
+    assert csv_report.strip() == ",".join(index.REPORT_FIELDS)
+
+
+@mock_aws
+def test_report_retries_throttling_and_is_truncated_when_out_of_time():
+    """Test report mode retries throttled descriptions and stops at its time budget."""
+    acm_client = boto3.client("acm")
+    for domain in ["example.com", "example.org"]:
+        acm_client.request_certificate(DomainName=domain, SubjectAlternativeNames=[domain])
+    boto3.client("s3").create_bucket(Bucket="example-cert-bucket")
+    create_client = boto3.client
+    describe_certificate = acm_client.describe_certificate
+    throttled = index.ClientError(
+        {"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}},
+        "DescribeCertificate",
+    )
+
+    def acm_or_real_client(service, **kwargs):
+        return acm_client if service == "acm" else create_client(service, **kwargs)
+
+    throttled_calls = []
+
+    def throttle_twice(**kwargs):
+        if len(throttled_calls) < 2:
+            throttled_calls.append(kwargs)
+            raise throttled
+        return describe_certificate(**kwargs)
+
+    with patch("src.index.boto3.client", side_effect=acm_or_real_client):
+        with patch("src.index.time.sleep"):
+            with patch.object(acm_client, "describe_certificate", side_effect=throttle_twice):
+                report = json.loads(index.handler({"mode": "report", "days": 400}, {}))
+        assert len(throttled_calls) == 2
+        assert len(report["certificates"]) == 2
+        assert not report["truncated"]
+
+        # Throttling that outlasts the report budget returns what was described
+        with patch.object(acm_client, "describe_certificate", side_effect=throttled):
+            with patch.dict(os.environ, {"PHASE_BUDGET_REPORT": "0.2"}):
+                report = json.loads(index.handler({"mode": "report", "days": 400}, {}))
+        assert report == {"certificates": [], "truncated": True}
+
+
+@mock_aws
+def test_retry_in_a_warm_container_reimports_instead_of_duplicating():
+    """Test a retry after a failed import checkpoint finds the imported certificate."""
+    cert = self_signed_certificate("example.com", 90)
+    mock_s3_client = boto3.client("s3")
+    mock_s3_client.create_bucket(Bucket="example-cert-bucket")
+    boto3.client("sns").create_topic(Name="example-topic")
+    mock_s3_client.put_object(
+        Bucket="example-cert-bucket",
+        Key="certbot-checkpoint.json",
+        Body=json.dumps({
+            "domains": "example.com",
+            "phase": "stored",
+            **{key: value.decode("utf-8") for key, value in cert.items()},
+        }),
+    )
+
+    save_checkpoint = index.save_checkpoint
+
+    def fail_after_import(storage_method, domains, phase, *args, **kwargs):
+        if phase == "imported":
+            raise RuntimeError("Lost the connection before checkpointing")
+        return save_checkpoint(storage_method, domains, phase, *args, **kwargs)
+
+    with patch("src.index.save_checkpoint", side_effect=fail_after_import):
+        with pytest.raises(RuntimeError):
+            index.handler({}, {})
+
+    index.handler({}, {})
+
+    certificates = boto3.client("acm").list_certificates()["CertificateSummaryList"]
+    assert len(certificates) == 1
+
+
+@mock_aws
+@patch("certbot.main.main")
+@patch("src.index.notify_via_sns")
+@patch("src.index.upload_cert_to_acm")
+def test_handler_resumes_from_checkpoint_without_reissuing(
+    mock_upload_cert_to_acm, mock_notify_via_sns, mock_certbot_main
+):
+    """Test a checkpointed issuance resumes at the failed phase."""
+    mock_upload_cert_to_acm.return_value = {"us-east-1": "arn:aws:acm:us-east-1:123456789012:certificate/1"}
+    cert = self_signed_certificate("example.com", 90)
+    mock_s3_client = boto3.client("s3")
+    mock_s3_client.create_bucket(Bucket="example-cert-bucket")
+    mock_s3_client.put_object(
+        Bucket="example-cert-bucket",
+        Key="certbot-checkpoint.json",
+        Body=json.dumps({
+            "domains": "example.com",
+            "phase": "stored",
+            **{key: value.decode("utf-8") for key, value in cert.items()},
+        }),
+    )
+
+    index.handler({}, {})
+
+    mock_certbot_main.assert_not_called()
+    mock_upload_cert_to_acm.assert_called_once_with(cert, "example.com", "s3")
+    mock_notify_via_sns.assert_called_once()
+    # Files were stored before the checkpoint, so they are not written again
+    response = mock_s3_client.list_objects_v2(Bucket="example-cert-bucket")
+    assert [obj["Key"] for obj in response["Contents"]] == ["certbot-checkpoint.json"]
+    obj = mock_s3_client.get_object(
+        Bucket="example-cert-bucket", Key="certbot-checkpoint.json"
+    )
+    assert json.loads(obj["Body"].read()) == {
+        "domains": "example.com",
+        "phase": "notified",
+        "certificate_arns": {"us-east-1": "arn:aws:acm:us-east-1:123456789012:certificate/1"},
+    }
+
+
+@mock_aws
+@patch("src.index.provision_cert")
+def test_checkpoint_expiring_within_reissue_days_is_not_resumed(mock_provision_cert):
+    """Test a stale checkpoint is discarded and the certificate is issued again."""
+    index.find_existing_cert.cache_clear()
+    fresh = self_signed_certificate("example.com", 90)
+    mock_provision_cert.return_value = fresh
+    mock_s3_client = boto3.client("s3")
+    mock_s3_client.create_bucket(Bucket="example-cert-bucket")
+    boto3.client("sns").create_topic(Name="example-topic")
+    mock_s3_client.put_object(
+        Bucket="example-cert-bucket",
+        Key="certbot-checkpoint.json",
+        Body=json.dumps({
+            "domains": "example.com",
+            "phase": "stored",
+            **{
+                key: value.decode("utf-8")
+                for key, value in self_signed_certificate("example.com", 10).items()
+            },
+        }),
+    )
+
+    index.handler({}, {})
+
+    mock_provision_cert.assert_called_once()
+    obj = mock_s3_client.get_object(Bucket="example-cert-bucket", Key="cert.pem")
+    assert obj["Body"].read() == fresh["certificate"]
+    index.find_existing_cert.cache_clear()
+
+
+@mock_aws
+@patch("src.index.notify_via_sns", side_effect=RuntimeError("KMS key is disabled"))
+@patch("src.index.upload_cert_to_acm")
+def test_failed_notification_does_not_pin_the_checkpoint(
+    mock_upload_cert_to_acm, mock_notify_via_sns
+):
+    """Test a notification that keeps failing still completes the issuance."""
+    mock_upload_cert_to_acm.return_value = {"us-east-1": "arn:aws:acm:us-east-1:123456789012:certificate/1"}
+    mock_s3_client = boto3.client("s3")
+    mock_s3_client.create_bucket(Bucket="example-cert-bucket")
+    mock_s3_client.put_object(
+        Bucket="example-cert-bucket",
+        Key="certbot-checkpoint.json",
+        Body=json.dumps({
+            "domains": "example.com",
+            "phase": "imported",
+            "certificate_arns": mock_upload_cert_to_acm.return_value,
+            **{
+                key: value.decode("utf-8")
+                for key, value in self_signed_certificate("example.com", 90).items()
+            },
+        }),
+    )
+
+    index.handler({}, {})
+
+    mock_notify_via_sns.assert_called_once()
+    mock_upload_cert_to_acm.assert_not_called()
+    obj = mock_s3_client.get_object(
+        Bucket="example-cert-bucket", Key="certbot-checkpoint.json"
+    )
+    assert json.loads(obj["Body"].read())["phase"] == "notified"
+
+
+@patch("src.index.time.sleep")
+def test_run_phase_retries_throttling_with_backoff(mock_sleep):
+    """Test throttled calls are retried within the phase budget."""
+    throttled = index.ClientError(
+        {"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}},
+        "ListCertificates",
+    )
+    func = MagicMock(side_effect=[throttled, throttled, "done"])
+
+    index.start_deadline(None)
+    assert index.run_phase("scan", func, "arg") == "done"
+
+    assert func.call_count == 3
+    assert mock_sleep.call_count == 2
+    assert mock_sleep.call_args_list[1].args[0] > mock_sleep.call_args_list[0].args[0] / 2
+
+    func = MagicMock(side_effect=throttled)
+    with pytest.raises(index.ClientError):
+        index.run_phase("import", func, retry=False)
+    func.assert_called_once()
+
+
+@mock_aws
+@patch("src.index.upload_cert_to_acm")
+def test_handler_stops_before_a_phase_when_out_of_time(mock_upload_cert_to_acm):
+    """Test the handler stops at a checkpoint instead of starting a phase it can't finish."""
+    mock_s3_client = boto3.client("s3")
+    mock_s3_client.create_bucket(Bucket="example-cert-bucket")
+    checkpoint = {
+        "domains": "example.com",
+        "phase": "stored",
+        **{
+            key: value.decode("utf-8")
+            for key, value in self_signed_certificate("example.com", 90).items()
+        },
+    }
+    mock_s3_client.put_object(
+        Bucket="example-cert-bucket",
+        Key="certbot-checkpoint.json",
+        Body=json.dumps(checkpoint),
+    )
+
+    # Enough time for the scan phase, but not for the import phase
+    context = MagicMock(aws_request_id="request-id")
+    context.get_remaining_time_in_millis.return_value = 9000
+    with patch.dict(os.environ, {"PHASE_MINIMUM_IMPORT": "30"}):
+        with pytest.raises(index.DeadlineExceeded):
+            index.handler({}, context)
+
+    mock_upload_cert_to_acm.assert_not_called()
+    obj = mock_s3_client.get_object(
+        Bucket="example-cert-bucket", Key="certbot-checkpoint.json"
+    )
+    assert json.loads(obj["Body"].read()) == checkpoint
+    response = mock_s3_client.list_objects_v2(Bucket="example-cert-bucket")
+    assert "certbot.lock" not in [obj["Key"] for obj in response["Contents"]]
@@ -0,0 +1,214 @@
+"""Tests for the consumer-side certificate reader."""
+import os
+import sys
+from unittest.mock import patch
+
+import boto3
+import pytest
+from moto import mock_aws
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import src.index as index # pylint: disable=wrong-import-position
+import src.reader as reader # pylint: disable=wrong-import-position
+
+FILES = {
+    "cert.pem": b"certificate",
+    "privkey.pem": b"private key",
+    "chain.pem": b"chain",
+}
+
+
+@mock_aws
+def test_s3_reader_only_downloads_when_the_serial_changes(tmp_path):
+    """Test the S3 reader revalidates with HeadObject and the serial metadata."""
+    client = boto3.client("s3")
+    client.create_bucket(Bucket="example-cert-bucket")
+    for name, contents in FILES.items():
+        client.put_object(
+            Bucket="example-cert-bucket",
+            Key="certs/" + name,
+            Body=contents,
+            Metadata={"serial": "01"},
+        )
+
+    with patch.object(client, "get_object", wraps=client.get_object) as mock_get:
+        cert, changed = reader.fetch_certificate(
+            "s3", "example-cert-bucket", str(tmp_path), "certs/", client=client
+        )
+        assert changed
+        assert cert["certificate"] == b"certificate"
+        assert cert["private_key"] == b"private key"
+        assert mock_get.call_count == 3
+
+        # Rewriting an object with the same serial doesn't trigger a download
+        client.put_object(
+            Bucket="example-cert-bucket",
+            Key="certs/chain.pem",
+            Body=b"chain",
+            Metadata={"serial": "01"},
+        )
+        cert, changed = reader.fetch_certificate(
+            "s3", "example-cert-bucket", str(tmp_path), "certs/", client=client
+        )
+        assert not changed
+        assert cert["certificate_chain"] == b"chain"
+        assert mock_get.call_count == 3
+
+        for name, contents in FILES.items():
+            client.put_object(
+                Bucket="example-cert-bucket",
+                Key="certs/" + name,
+                Body=b"new " + contents,
+                Metadata={"serial": "02"},
+            )
+        cert, changed = reader.fetch_certificate(
+            "s3", "example-cert-bucket", str(tmp_path), "certs/", client=client
+        )
+        assert changed
+        assert cert["certificate"] == b"new certificate"
+        assert cert["private_key"] == b"new private key"
+        assert mock_get.call_count == 6
+
+
+@mock_aws
+def test_s3_reader_keeps_the_cache_while_the_files_are_rewritten(tmp_path):
+    """Test a new certificate next to the old key and chain isn't cached."""
+    client = boto3.client("s3")
+    client.create_bucket(Bucket="example-cert-bucket")
+    for name, contents in FILES.items():
+        client.put_object(
+            Bucket="example-cert-bucket", Key=name, Body=contents, Metadata={"serial": "01"}
+        )
+    reader.fetch_certificate("s3", "example-cert-bucket", str(tmp_path), client=client)
+
+    # The function has written the new cert.pem but not yet the key and chain
+    client.put_object(
+        Bucket="example-cert-bucket", Key="cert.pem", Body=b"new certificate", Metadata={"serial": "02"}
+    )
+    cert, changed = reader.fetch_certificate("s3", "example-cert-bucket", str(tmp_path), client=client)
+    assert not changed
+    assert cert["certificate"] == b"certificate"
+
+    with pytest.raises(RuntimeError):
+        reader.fetch_certificate("s3", "example-cert-bucket", str(tmp_path / "empty"), client=client)
+
+    for name in ["privkey.pem", "chain.pem"]:
+        client.put_object(
+            Bucket="example-cert-bucket", Key=name, Body=b"new " + FILES[name], Metadata={"serial": "02"}
+        )
+    cert, changed = reader.fetch_certificate("s3", "example-cert-bucket", str(tmp_path), client=client)
+    assert changed
+    assert cert == {
+        "certificate": b"new certificate",
+        "private_key": b"new private key",
+        "certificate_chain": b"new chain",
+    }
+
+
+@mock_aws
+def test_secrets_manager_reader_compares_version_ids(tmp_path):
+    """Test the Secrets Manager reader only reads the values when a version changes."""
+    client = boto3.client("secretsmanager")
+    for name, contents in FILES.items():
+        client.create_secret(Name="/certs/" + name, SecretString=contents.decode("utf-8"))
+
+    with patch.object(client, "get_secret_value", wraps=client.get_secret_value) as mock_get:
+        _cert, changed = reader.fetch_certificate("secretsmanager", "/certs/", str(tmp_path), client=client)
+        assert changed
+        _cert, changed = reader.fetch_certificate("secretsmanager", "/certs/", str(tmp_path), client=client)
+        assert not changed
+        # The three files and the manifest, and nothing more on the second call
+        assert mock_get.call_count == 4
+
+        client.put_secret_value(SecretId="/certs/privkey.pem", SecretString="new key")
+        cert, changed = reader.fetch_certificate("secretsmanager", "/certs/", str(tmp_path), client=client)
+        assert changed
+        assert cert["private_key"] == b"new key"
+
+
+@mock_aws
+def test_parameter_store_reader_compares_versions(tmp_path):
+    """Test the Parameter Store reader checks versions without decrypting."""
+    client = boto3.client("ssm")
+    for name, contents in FILES.items():
+        client.put_parameter(Name="/certs/" + name, Value=contents.decode("utf-8"), Type="SecureString")
+
+    _cert, changed = reader.fetch_certificate("ssm_secure", "/certs/", str(tmp_path), client=client)
+    assert changed
+    with patch.object(client, "get_parameters", wraps=client.get_parameters) as mock_get:
+        _cert, changed = reader.fetch_certificate("ssm_secure", "/certs/", str(tmp_path), client=client)
+    assert not changed
+    mock_get.assert_called_once()
+    assert mock_get.call_args.kwargs["WithDecryption"] is False
+
+
+def test_efs_reader_uses_the_cache_until_a_file_changes(tmp_path):
+    """Test the EFS reader detects rewritten files."""
+    efs = tmp_path / "efs" / "certs"
+    efs.mkdir(parents=True)
+    for name, contents in FILES.items():
+        (efs / name).write_bytes(contents)
+    cache = str(tmp_path / "cache")
+
+    _cert, changed = reader.fetch_certificate("efs", str(tmp_path / "efs"), cache, "certs")
+    assert changed
+    _cert, changed = reader.fetch_certificate("efs", str(tmp_path / "efs"), cache, "certs")
+    assert not changed
+
+    # A rewrite with the same contents changes the mtime but not the digest
+    os.utime(efs / "chain.pem", ns=(0, 0))
+    with patch.object(reader, "efs_files", wraps=reader.efs_files) as mock_files:
+        _cert, changed = reader.fetch_certificate("efs", str(tmp_path / "efs"), cache, "certs")
+        assert not changed
+        _cert, changed = reader.fetch_certificate("efs", str(tmp_path / "efs"), cache, "certs")
+        assert not changed
+    mock_files.assert_called_once()
+
+    (efs / "cert.pem").write_bytes(b"reissued certificate")
+    cert, changed = reader.fetch_certificate("efs", str(tmp_path / "efs"), cache, "certs")
+    assert changed
+    assert cert["certificate"] == b"reissued certificate"
+    cached = reader.cache_directory(cache, "efs", str(tmp_path / "efs"), "certs")
+    assert (cached / "privkey.pem").stat().st_mode & 0o777 == 0o600
+
+
+def reissue_part_way(storage_method, location, cache, prefix=""):
+    """Store two certificates with the function, reading while the second is half written."""
+    old = {"certificate": b"certificate", "private_key": b"private key", "certificate_chain": b"chain"}
+    new = {key: b"new " + value for key, value in old.items()}
+    index.store_cert(old, storage_method)
+    reader.fetch_certificate(storage_method, location, cache, prefix)
+
+    store_files = index.store_files
+
+    def store_only_the_certificate(files, method):
+        store_files({"cert.pem": files["cert.pem"]}, method)
+
+    # The new cert.pem is stored, but not yet the key, chain and manifest
+    with patch("src.index.store_files", side_effect=store_only_the_certificate):
+        index.store_cert(new, storage_method)
+    cert, changed = reader.fetch_certificate(storage_method, location, cache, prefix)
+    assert not changed
+    assert cert == old
+    with pytest.raises(RuntimeError):
+        reader.fetch_certificate(storage_method, location, cache + "-empty", prefix)
+
+    index.store_cert(new, storage_method)
+    cert, changed = reader.fetch_certificate(storage_method, location, cache, prefix)
+    assert changed
+    assert cert == new
+
+
+@mock_aws
+def test_secrets_manager_and_parameter_store_readers_wait_for_the_manifest(tmp_path):
+    """Test a new certificate next to the old key and chain isn't cached."""
+    with patch.dict(os.environ, {"CERTIFICATE_SECRET_PATH": "/certs/"}):
+        reissue_part_way("secretsmanager", "/certs/", str(tmp_path / "secrets"))
+    with patch.dict(os.environ, {"CERTIFICATE_PARAMETER_PATH": "/certs/"}):
+        reissue_part_way("ssm_secure", "/certs/", str(tmp_path / "parameters"))
+
+
+def test_efs_reader_waits_for_the_manifest(tmp_path):
+    """Test an EFS file set that is being rewritten isn't cached."""
+    with patch.dict(os.environ, {"EFS_PATH": str(tmp_path / "efs"), "OBJECT_PREFIX": "certs"}):
+        reissue_part_way("efs", str(tmp_path / "efs"), str(tmp_path / "cache"), "certs")
@@ -0,0 +1,78 @@
+import * as crypto from 'crypto';
+import * as fs from 'fs';
+import * as path from 'path';
+
+import {
+  aws_lambda as lambda,
+  AssetHashType,
+  Stack,
+} from 'aws-cdk-lib';
+import { Construct } from 'constructs';
+
+export const functionDir = path.join(__dirname, '../function/src');
+
+/**
+ * The bundling steps, shared with the benchmarks in `function/benchmarks` so both
+ * always run the same commands.
+ */
+const bundlingSteps = JSON.parse(
+  fs.readFileSync(path.join(__dirname, '../function/bundling.json'), 'utf-8'),
+);
+
+/**
+ * Build the shell commands that install the function dependencies into a directory.
+ *
+ * The handler only uses the dns-route53 authenticator, so test suites and the web
+ * server plugins are dropped. The Lambda filesystem is read-only, so bytecode is
+ * precompiled in a form that is valid without an mtime check.
+ */
+export function dependencyBundlingCommands(outputDir: string, architecture: lambda.Architecture): string[] {
+  // Determine the platform for pip based on the Lambda architecture
+  const pipPlatform: string = bundlingSteps.platforms[architecture.name];
+
+  return [
+    ...bundlingSteps.install,
+    ...bundlingSteps.optimize,
+    ...bundlingSteps.report,
+  ].map((command: string) => command
+    .replace(/\{output\}/g, outputDir)
+    .replace(/\{platform\}/g, pipPlatform));
+}
+
+/**
+ * Get the dependency layer for an architecture, creating it once per stack.
+ *
+ * The layer is keyed by architecture and by a hash of the requirements and the
+ * bundling commands, so every Certbot construct in the stack with the same
+ * architecture shares one layer and one asset.
+ */
+export function getDependencyLayer(scope: Construct, architecture: lambda.Architecture): lambda.LayerVersion {
+  const stack = Stack.of(scope);
+  const commands = dependencyBundlingCommands('/asset-output/python', architecture);
+  const hash = crypto.createHash('sha256')
+    .update(fs.readFileSync(path.join(functionDir, 'requirements.txt')))
+    .update(commands.join('\n'))
+    .digest('hex');
+
+  const id = `CertbotDependencies-${architecture.name}-${hash.slice(0, 12)}`;
+  const existing = stack.node.tryFindChild(id) as lambda.LayerVersion | undefined;
+  if (existing) {
+    return existing;
+  }
+
+  return new lambda.LayerVersion(stack, id, {
+    description: 'Certbot, acme, cryptography and boto3 for the Certbot renewal functions',
+    compatibleRuntimes: [lambda.Runtime.PYTHON_3_13],
+    compatibleArchitectures: [architecture],
+    code: lambda.Code.fromAsset(functionDir, {
+      assetHash: hash,
+      assetHashType: AssetHashType.CUSTOM,
+      bundling: {
+        image: lambda.Runtime.PYTHON_3_13.bundlingImage,
+        command: [
+          'bash', '-c', commands.join(' && '),
+        ],
+      },
+    }),
+  });
+}
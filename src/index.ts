@@ -1,5 +1,3 @@
-import * as path from 'path';
-
 import * as oneTimeEvents from '@renovosolutions/cdk-library-one-time-event';
 import {
   aws_ec2 as ec2,
@@ -15,8 +13,10 @@ import {
   Duration,
   RemovalPolicy,
   Stack,
+  Token,
 } from 'aws-cdk-lib';
 import { Construct } from 'constructs';
+import { dependencyBundlingCommands, functionDir, getDependencyLayer } from './dependency-layer';
 import { assignRequiredPoliciesToRole } from './required-policies';
 import {
   // configureBucketStorage,
@@ -88,6 +88,10 @@ export interface CertbotProps {
   /**
    * Set the key type for the certificate.
    *
+   * One of the issuance profiles 'rsa2048', 'rsa3072', 'rsa4096', 'ecdsa-p256' and
+   * 'ecdsa-p384', which set both the key type and its size or curve. 'rsa' and 'ecdsa'
+   * are accepted for 'rsa2048' and 'ecdsa-p256'.
+   *
    * @default 'ecdsa'
    */
   readonly keyType?: string;
@@ -111,6 +115,15 @@ export interface CertbotProps {
    * @default Duraction.seconds(180)
    */
   readonly timeout?: Duration;
+  /**
+   * The amount of memory, in MB, allocated to the Lambda function.
+   *
+   * Lambda allocates CPU in proportion to memory, which shortens key generation
+   * and the certbot import. Use the harness in `function/benchmarks` to pick a value.
+   *
+   * @default 128
+   */
+  readonly memorySize?: number;
   /**
    * The architecture for the Lambda function.
    *
@@ -121,6 +134,17 @@ export interface CertbotProps {
    * @default lambda.Architecture.X86_64
    */
   readonly architecture?: lambda.Architecture;
+  /**
+   * Whether to package certbot and its dependencies as a Lambda layer instead of
+   * bundling them into the function.
+   *
+   * The layer is built once per stack for each architecture and requirements hash
+   * and shared by every Certbot construct in the stack, so only the handler code is
+   * uploaded per function.
+   *
+   * @default false
+   */
+  readonly useDependencyLayer?: boolean;
   /**
    * The schedule for the certificate check trigger.
    *
@@ -163,6 +187,25 @@ export interface CertbotProps {
    * @default false
    */
   readonly enableObjectDeletion?: boolean;
+  /**
+   * Whether to also write a single `bundle.pem` containing the certificate, chain and
+   * private key when storing certificates in S3.
+   *
+   * Has no effect with other storage types
+   *
+   * @default false
+   */
+  readonly combinedBundle?: boolean;
+  /**
+   * The regions to import the certificate into.
+   *
+   * One issuance is imported into every region in parallel, so a single construct can
+   * serve CloudFront in us-east-1 as well as load balancers in other regions. The list
+   * replaces the default, so include the stack region if it is needed there.
+   *
+   * @default - the stack region
+   */
+  readonly acmRegions?: string[];
   /**
    * The method of storage for the resulting certificates.
    *
@@ -220,6 +263,11 @@ export class Certbot extends Construct {
       throw new Error('You must provide either hostedZoneNames or hostedZones');
     }
 
+    const keyTypes = ['rsa2048', 'rsa3072', 'rsa4096', 'ecdsa-p256', 'ecdsa-p384', 'rsa', 'ecdsa'];
+    if (props.keyType && !Token.isUnresolved(props.keyType) && !keyTypes.includes(props.keyType.toLowerCase())) {
+      throw new Error(`keyType must be one of ${keyTypes.join(', ')}`);
+    }
+
     // Create an SNS topic if one is not provided and add the defined email to it
     let snsTopic: sns.Topic = props.snsTopic ?? new sns.Topic(this, 'topic');
     if (props.snsTopic === undefined) {
@@ -250,35 +298,41 @@ export class Certbot extends Construct {
       role,
       snsTopic,
       hostedZones,
+      acmRegions: props.acmRegions,
     });
 
-    const functionDir = path.join(__dirname, '../function/src');
-
-    // Determine the platform for pip based on the Lambda architecture
     const architecture = props.architecture || lambda.Architecture.X86_64;
-    const pipPlatform = architecture === lambda.Architecture.ARM_64
-      ? 'manylinux2014_aarch64'
-      : 'manylinux2014_x86_64';
-
-    const bundlingCmds = [
-      'mkdir -p /asset-output',
-      `pip install -r /asset-input/requirements.txt -t /asset-output --platform ${pipPlatform} --implementation cp --python-version 3.13 --only-binary=:all: --upgrade`,
-      'cp index.py /asset-output/index.py',
-    ];
 
-    // Create the Lambda function
-    this.handler = new lambda.Function(this, 'handler', {
-      runtime: lambda.Runtime.PYTHON_3_13,
-      role,
-      architecture,
-      code: lambda.Code.fromAsset(functionDir, {
+    // Either ship the dependencies in a layer shared across the stack and keep only
+    // the handler in the function asset, or bundle everything into the function
+    let code: lambda.Code;
+    if (props.useDependencyLayer) {
+      layers = [getDependencyLayer(this, architecture), ...layers];
+      code = lambda.Code.fromAsset(functionDir, {
+        exclude: ['*', '!index.py'],
+      });
+    } else {
+      const bundlingCmds = [
+        'mkdir -p /asset-output',
+        'cp index.py /asset-output/index.py',
+        ...dependencyBundlingCommands('/asset-output', architecture),
+      ];
+      code = lambda.Code.fromAsset(functionDir, {
         bundling: {
           image: lambda.Runtime.PYTHON_3_13.bundlingImage,
           command: [
             'bash', '-c', bundlingCmds.join(' && '),
           ],
         },
-      }),
+      });
+    }
+
+    // Create the Lambda function
+    this.handler = new lambda.Function(this, 'handler', {
+      runtime: lambda.Runtime.PYTHON_3_13,
+      role,
+      architecture,
+      code,
       handler: 'index.handler',
       functionName: props.functionName,
       description: functionDescription,
@@ -294,6 +348,7 @@ export class Certbot extends Construct {
       },
       layers,
       timeout: props.timeout || Duration.seconds(180),
+      memorySize: props.memorySize,
       filesystem: props.efsAccessPoint ? lambda.FileSystem.fromEfsAccessPoint(props.efsAccessPoint, '/mnt/efs') : undefined,
       vpc: props.vpc,
     });
@@ -327,6 +382,14 @@ export class Certbot extends Construct {
       this.handler.addEnvironment('CERTIFICATE_STORAGE', 's3');
     }
 
+    if (props.combinedBundle) {
+      this.handler.addEnvironment('COMBINED_BUNDLE', 'True');
+    }
+
+    if (props.acmRegions) {
+      this.handler.addEnvironment('ACM_REGIONS', props.acmRegions.join(','));
+    }
+
     if (props.certificateStorage == CertificateStorageType.SECRETS_MANAGER) {
       this.handler.addEnvironment('CERTIFICATE_STORAGE', 'secretsmanager');
       this.handler.addEnvironment('CERTIFICATE_SECRET_PATH', props.secretsManagerPath || `/certbot/certificates/${props.letsencryptDomains.split(',')[0]}/`);
@@ -18,6 +18,12 @@ interface RequiredPoliciesProps {
    * The hostedZones that will be required for DNS verification with certbot
    */
   readonly hostedZones: string[];
+  /**
+   * The regions certificates are imported into
+   *
+   * @default - the stack region
+   */
+  readonly acmRegions?: string[];
 };
 
 export function assignRequiredPoliciesToRole(scope: Construct, props: RequiredPoliciesProps): void {
@@ -66,8 +72,15 @@ export function assignRequiredPoliciesToRole(scope: Construct, props: RequiredPo
       }),
       new iam.PolicyStatement({
         effect: iam.Effect.ALLOW,
-        actions: ['acm:DescribeCertificate'],
-        resources: ['arn:aws:acm:' + Stack.of(scope).region + ':' + Stack.of(scope).account + ':certificate/*'],
+        actions: [
+          'acm:AddTagsToCertificate',
+          'acm:DescribeCertificate',
+          'acm:ListTagsForCertificate',
+        ],
+        // The stack region stays allowed for report mode and the default region
+        resources: [...new Set([Stack.of(scope).region, ...(props.acmRegions ?? [])])].map(
+          region => 'arn:aws:acm:' + region + ':' + Stack.of(scope).account + ':certificate/*',
+        ),
       }),
     ],
   }));
@@ -36,6 +36,7 @@ export function configureSecretsManagerStorage(scope: Construct, props: SecretsM
           'secretsmanager:ListSecrets',
           'secretsmanager:PutSecretValue',
           'secretsmanager:UpdateSecret',
+          'secretsmanager:UpdateSecretVersionStage',
         ],
         resources: [
           `arn:aws:secretsmanager:${Stack.of(scope).region}:${Stack.of(scope).account}:secret:${props.secretsManagerPath}*`,
@@ -50,6 +51,13 @@ export function configureSecretsManagerStorage(scope: Construct, props: SecretsM
           keyArn,
         ],
       }),
+      // ListSecrets does not support resource level permissions
+      new iam.PolicyStatement({
+        actions: [
+          'secretsmanager:ListSecrets',
+        ],
+        resources: ['*'],
+      }),
     ],
   }));
 }
@@ -78,6 +86,8 @@ export function configureSSMStorage(scope: Construct, props: SsmStorageProps): v
     statements: [
       new iam.PolicyStatement({
         actions: [
+          'ssm:DeleteParameter',
+          'ssm:GetParameters',
           'ssm:PutParameter',
         ],
         resources: [
@@ -4,6 +4,7 @@ import {
   aws_efs as efs,
   aws_s3 as s3,
   aws_kms as kms,
+  aws_lambda as lambda,
   App,
   Stack,
   aws_route53 as route53,
@@ -250,6 +251,7 @@ test('stack should contain no bucket when secrets manager is used and have appro
             'secretsmanager:ListSecrets',
             'secretsmanager:PutSecretValue',
             'secretsmanager:UpdateSecret',
+            'secretsmanager:UpdateSecretVersionStage',
           ]),
           Effect: 'Allow',
           Resource: Match.stringLikeRegexp('arn:aws:secretsmanager:us-east-1:123456789012:secret:\/certbot\/certificates\/test.local\/.*'),
@@ -312,6 +314,7 @@ test('stack should have policy with specific resource path when path is given fo
             'secretsmanager:ListSecrets',
             'secretsmanager:PutSecretValue',
             'secretsmanager:UpdateSecret',
+            'secretsmanager:UpdateSecretVersionStage',
           ]),
           Effect: 'Allow',
           Resource: Match.stringLikeRegexp('arn:aws:secretsmanager:us-east-1:123456789012:secret:\/certbot\/alternate\/path\/.*'),
@@ -361,7 +364,10 @@ test('stack should contain no bucket when parameter store is used and have appro
     PolicyDocument: {
       Statement: Match.arrayWith([
         {
-          Action: 'ssm:PutParameter',
+          Action: Match.arrayWith([
+            'ssm:GetParameters',
+            'ssm:PutParameter',
+          ]),
           Effect: 'Allow',
           Resource: Match.stringLikeRegexp('arn:aws:ssm:us-east-1:123456789012:parameter\/certbot\/certificates\/test.local\/.*'),
         },
@@ -416,7 +422,10 @@ test('stack should have policy with specific resource path when path is given fo
     PolicyDocument: {
       Statement: Match.arrayWith([
         {
-          Action: 'ssm:PutParameter',
+          Action: Match.arrayWith([
+            'ssm:GetParameters',
+            'ssm:PutParameter',
+          ]),
           Effect: 'Allow',
           Resource: Match.stringLikeRegexp('arn:aws:ssm:us-east-1:123456789012:parameter\/certbot\/alternate\/path\/.*'),
         },
@@ -499,6 +508,47 @@ test('construct should allow insights to be enabled', () => {
   template.resourceCountIs('AWS::EC2::VPC', 0);
 });
 
+test('acm regions and the stack region should be allowed by the acm policy', () => {
+  const app = new App();
+  const stack = new Stack(app, 'TestStack', {
+    env: {
+      account: '123456789012', // not a real account
+      region: 'eu-west-2',
+    },
+  });
+
+  new Certbot(stack, 'Certbot', {
+    letsencryptDomains: 'test.local',
+    letsencryptEmail: 'test@test.local',
+    hostedZoneNames: ['example.com'],
+    acmRegions: ['us-east-1', 'eu-west-1'],
+  });
+
+  const template = Template.fromStack(stack);
+
+  template.hasResourceProperties('AWS::Lambda::Function', {
+    Environment: {
+      Variables: Match.objectLike({
+        ACM_REGIONS: 'us-east-1,eu-west-1',
+      }),
+    },
+  });
+  template.hasResourceProperties('AWS::IAM::ManagedPolicy', {
+    PolicyDocument: {
+      Statement: Match.arrayWith([
+        Match.objectLike({
+          Action: Match.arrayWith(['acm:DescribeCertificate']),
+          Resource: [
+            'arn:aws:acm:eu-west-2:123456789012:certificate/*',
+            'arn:aws:acm:us-east-1:123456789012:certificate/*',
+            'arn:aws:acm:eu-west-1:123456789012:certificate/*',
+          ],
+        }),
+      ]),
+    },
+  });
+});
+
 test('disabling run on deploy should reduce total event rule count to 1', () => {
   const app = new App();
   const stack = new Stack(app, 'TestStack', {
@@ -548,6 +598,25 @@ test('not providing zone names or zones should throw an error', () => {
   }).toThrow('You must provide either hostedZoneNames or hostedZones');
 });
 
+test('providing an unknown key type should throw an error', () => {
+  const app = new App();
+  const stack = new Stack(app, 'TestStack', {
+    env: {
+      account: '123456789012', // not a real account
+      region: 'us-east-1',
+    },
+  });
+
+  expect(() => {
+    new Certbot(stack, 'Certbot', {
+      letsencryptDomains: 'test.local',
+      letsencryptEmail: 'test@test.local',
+      hostedZoneNames: ['example.com'],
+      keyType: 'ecdsa-p521',
+    });
+  }).toThrow('keyType must be one of');
+});
+
 test('Multiple certs in one stack does not error', () => {
   const app = new App();
   const stack = new Stack(app, 'TestStack', {
@@ -702,3 +771,48 @@ test('not providing vpc when efs is used should throw an error', () => {
   }).toThrow('Cannot configure \'filesystem\' without configuring a VPC.');
 });
 
+
+test('dependency layer should be shared by constructs with the same architecture', () => {
+  const app = new App();
+  const stack = new Stack(app, 'TestStack', {
+    env: {
+      account: '123456789012', // not a real account
+      region: 'us-east-1',
+    },
+  });
+
+  new Certbot(stack, 'Certbot', {
+    letsencryptDomains: 'test.local',
+    letsencryptEmail: 'test@test.local',
+    hostedZoneNames: ['example.com'],
+    useDependencyLayer: true,
+  });
+
+  new Certbot(stack, 'Certbot2', {
+    letsencryptDomains: 'test2.local',
+    letsencryptEmail: 'test@test2.local',
+    hostedZoneNames: ['example.com'],
+    useDependencyLayer: true,
+  });
+
+  new Certbot(stack, 'Certbot3', {
+    letsencryptDomains: 'test3.local',
+    letsencryptEmail: 'test@test3.local',
+    hostedZoneNames: ['example.com'],
+    architecture: lambda.Architecture.ARM_64,
+    useDependencyLayer: true,
+  });
+
+  const template = Template.fromStack(stack);
+
+  template.resourceCountIs('AWS::Lambda::Function', 3);
+  template.resourceCountIs('AWS::Lambda::LayerVersion', 2); // one per architecture
+  template.hasResourceProperties('AWS::Lambda::LayerVersion', {
+    CompatibleArchitectures: ['arm64'],
+    CompatibleRuntimes: ['python3.13'],
+  });
+  template.hasResourceProperties('AWS::Lambda::Function', {
+    Architectures: ['x86_64'],
+    Layers: [Match.anyValue()],
+  });
+});